@@ -0,0 +1,131 @@
+import array
+import asyncio
+import time
+
+
+class AudioRing:
+    def __init__(self, block_size, depth=4):
+        self.depth = depth
+        self.resize(block_size)
+        # Single producer, single consumer: only the producer moves head and
+        # only the consumer moves tail. Both count modulo 2 * depth so a full
+        # ring can be told apart from an empty one without a shared counter.
+        self.head = 0
+        self.tail = 0
+        self.wrap = 2 * depth
+        self.blocks = 0
+        self.underruns = 0
+
+    def resize(self, block_size):
+        # Only the producer may call this, between two blocks. The counters
+        # stay where they are; blocks still queued play as silence and a
+        # slot the consumer holds stays valid until it lets go of it.
+        self.block_size = block_size
+        self.data = array.array("h", [0] * (block_size * self.depth))
+        view = memoryview(self.data)
+        self.slots = [
+            view[i * block_size : (i + 1) * block_size] for i in range(self.depth)
+        ]
+
+    def fill(self):
+        return (self.head - self.tail) % self.wrap
+
+    def is_full(self):
+        return self.fill() >= self.depth
+
+    def is_empty(self):
+        return self.head == self.tail
+
+    def write_slot(self):
+        if self.is_full():
+            return None
+        return self.slots[self.head % self.depth]
+
+    def commit(self):
+        self.head = (self.head + 1) % self.wrap
+
+    def read_slot(self):
+        if self.is_empty():
+            return None
+        return self.slots[self.tail % self.depth]
+
+    def release(self):
+        self.tail = (self.tail + 1) % self.wrap
+        self.blocks += 1
+
+    def get_stats(self):
+        return {
+            "fill": self.fill(),
+            "depth": self.depth,
+            "blocks": self.blocks,
+            "underruns": self.underruns,
+        }
+
+
+class AudioEngine:
+    def __init__(self, synth_instance, depth=4):
+        self.synth = synth_instance
+        self.ring = AudioRing(synth_instance.base.buffer_size, depth)
+        self.running = False
+        synth_instance.add_listener(self.configure)
+
+    def configure(self, base):
+        """Synth listener: follow a new block size."""
+        if base.buffer_size != self.ring.block_size:
+            self.ring.resize(base.buffer_size)
+
+    def render_loop(self):
+        """Producer: renders blocks into the ring. Meant to own core 1."""
+        ring = self.ring
+        synth_instance = self.synth
+        self.running = True
+        while self.running:
+            # A pending reconfigure has to land before a slot of the old
+            # size is taken.
+            synth_instance.apply_config()
+            slot = ring.write_slot()
+            if slot is None:
+                time.sleep_ms(1)
+                continue
+            synth_instance.render_into(slot)
+            ring.commit()
+
+    async def render_task(self, speaker):
+        """Producer on a single core: renders whenever the irq frees a slot."""
+        ring = self.ring
+        synth_instance = self.synth
+        while True:
+            synth_instance.apply_config()
+            speaker.apply_config()
+            slot = ring.write_slot()
+            if slot is None:
+                await speaker.ready.wait()
+                continue
+            synth_instance.render_into(slot)
+            ring.commit()
+            await asyncio.sleep_ms(0)
+
+    def stop(self):
+        self.running = False
+
+    async def feed(self, speaker):
+        """Consumer: moves rendered blocks from the ring to the I2S output."""
+        ring = self.ring
+        stream = asyncio.StreamWriter(speaker.audio)
+        starved = False
+        # The renderer on the other core must not touch the bus; a new
+        # config is picked up here, after the previous block has drained.
+        speaker.deferred = True
+        while True:
+            speaker.apply_config()
+            block = ring.read_slot()
+            if block is None:
+                if ring.blocks and not starved:
+                    ring.underruns += 1
+                starved = True
+                await asyncio.sleep_ms(1)
+                continue
+            starved = False
+            stream.write(block)
+            await stream.drain()
+            ring.release()
@@ -0,0 +1,42 @@
+import time
+
+# On the rp2 port ticks_ms() counts from power-on, so the first reading is
+# how long the firmware took to get to this script.
+power_on = time.ticks_ms()
+
+import gc
+import synth
+from memory import build_patch
+
+# Milliseconds from power-on to the first rendered audio block for the
+# main.py patch, with the tables from luts.py (if present) and with every
+# table computed at startup.
+#
+#   python tools/build_luts.py
+#   mpremote cp synth.py luts.py benchmarks/memory.py : + run benchmarks/boot.py
+
+
+def first_block():
+    t1 = time.ticks_ms()
+    SYNTH = build_patch()
+    t2 = time.ticks_ms()
+    SYNTH.get_buffer()
+    t3 = time.ticks_ms()
+    return time.ticks_diff(t2, t1), time.ticks_diff(t3, t2), t3
+
+
+imported = time.ticks_ms()
+frozen = len(synth.FROZEN_LUTS)
+build, render, done = first_block()
+print(f"power-on to script:     {power_on} ms")
+print(f"import synth:           {time.ticks_diff(imported, power_on)} ms")
+print(f"build patch:            {build} ms ({frozen} pre-generated tables)")
+print(f"first block:            {render} ms")
+print(f"power-on to first block: {done} ms")
+
+# The same patch again with nothing pre-generated and an empty cache.
+synth.FROZEN_LUTS = {}
+synth.LUTS.tables.clear()
+gc.collect()
+build, render, _ = first_block()
+print(f"computed tables:        build {build} ms, first block {render} ms")
@@ -0,0 +1,62 @@
+import memory
+
+# Highest sample rate the patch from main.py sustains, per block size. Every
+# step goes through Synth.reconfigure() on one synth, the way a running patch
+# would change rate. A rate passes when the mean block takes at most HEADROOM
+# of the deadline and the slowest block still makes it; between the last
+# passing and the first failing rate of RATES the limit is bisected down to
+# RESOLUTION Hz.
+#
+#   mpremote cp synth.py : + cp benchmarks/memory.py : + run benchmarks/capacity.py
+
+BUFFER_SIZES = [100, 200, 400]
+RATES = [8000, 11025, 16000, 22050, 32000, 44100]
+HEADROOM = 0.8
+RESOLUTION = 250
+BLOCKS = 16
+
+
+def measure(SYNTH, sample_rate, buffer_size):
+    SYNTH.reconfigure(sample_rate=sample_rate, buffer_size=buffer_size)
+    SYNTH.disable_profiling()
+    SYNTH.get_buffer()
+    SYNTH.enable_profiling(BLOCKS)
+    for _ in range(BLOCKS):
+        SYNTH.get_buffer()
+    profile = SYNTH.get_profile()
+    low, mean, high = profile["block"]
+    deadline = profile["deadline"]
+    return mean / deadline, mean <= HEADROOM * deadline and high <= deadline
+
+
+def capacity(SYNTH, buffer_size):
+    good = None
+    bad = None
+    for sample_rate in RATES:
+        load, ok = measure(SYNTH, sample_rate, buffer_size)
+        print(f"  {sample_rate:5} Hz  load {load:5.2f}  {'ok' if ok else 'too slow'}")
+        if not ok:
+            bad = sample_rate
+            break
+        good = sample_rate
+    if good is None or bad is None:
+        return good, bad
+    while bad - good > RESOLUTION:
+        middle = (good + bad) // 2
+        if measure(SYNTH, middle, buffer_size)[1]:
+            good = middle
+        else:
+            bad = middle
+    return good, bad
+
+
+SYNTH = memory.build_patch()
+for buffer_size in BUFFER_SIZES:
+    print(f"block {buffer_size}:")
+    best, limit = capacity(SYNTH, buffer_size)
+    if best is None:
+        print(f"  not even {RATES[0]} Hz")
+    elif limit is None:
+        print(f"  sustains every rate up to {best} Hz")
+    else:
+        print(f"  highest sustainable rate: {best} Hz")
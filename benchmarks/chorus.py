@@ -0,0 +1,56 @@
+import time
+import synth
+
+# Chorus.update() with one to CHORUS_VOICES taps in both modes, and the cost
+# each extra tap adds. For scale, the last line times the audio-rate Sine LFO
+# plus Mixer volume input that main.py uses to wobble a voice.
+#
+#   mpremote cp synth.py : + run benchmarks/chorus.py
+
+BLOCKS = 20
+
+
+def build():
+    SYNTH = synth.Synth(synth.Config())
+    frequency = SYNTH.add_module(synth.Input)
+    frequency.set_value(220)
+    source = SYNTH.add_module(synth.Sawtooth)
+    source.set("frequency", frequency)
+    return SYNTH, source
+
+
+def messure(*modules):
+    t1 = time.ticks_us()
+    for _ in range(BLOCKS):
+        for module in modules:
+            module.update()
+    elapsed = time.ticks_diff(time.ticks_us(), t1)
+    return elapsed * 1000 / (BLOCKS * modules[0].base.buffer_size)
+
+
+for mode in synth.Chorus.modes:
+    SYNTH, source = build()
+    chorus = SYNTH.add_module(synth.Chorus)
+    chorus.set("input", source)
+    chorus.set_mode(mode)
+    SYNTH.output.set("input", chorus)
+    SYNTH.get_buffer()
+    previous = None
+    for voices in range(1, synth.CHORUS_VOICES + 1):
+        chorus.set_voices(voices)
+        current = messure(chorus)
+        extra = "" if previous is None else f"  (+{current - previous:.0f} per voice)"
+        print(f"{mode:8} {voices} voices: {current:7.0f} ns/sample{extra}")
+        previous = current
+
+SYNTH, source = build()
+rate = SYNTH.add_module(synth.Input)
+rate.set_value(1)
+lfo = SYNTH.add_module(synth.Sine)
+lfo.set("frequency", rate)
+mixer = SYNTH.add_module(synth.Mixer)
+mixer.set("input0", source)
+mixer.set("input0_volume", lfo)
+SYNTH.output.set("input", mixer)
+SYNTH.get_buffer()
+print(f"Sine LFO + Mixer: {messure(lfo, mixer):7.0f} ns/sample")
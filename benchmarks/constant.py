@@ -0,0 +1,70 @@
+import time
+import synth
+from memory import build_patch
+
+# main.py's three frequency Inputs: the Sines reading them as constants
+# (one phase step per block) against reading a filled buffer per sample,
+# plus the cost of Input.set_value() and the buffer memory it saves.
+#
+#   mpremote cp synth.py benchmarks/memory.py : + run benchmarks/constant.py
+
+BLOCKS = 200
+
+
+def sines(SYNTH):
+    return [
+        m for m in SYNTH.modules
+        if isinstance(m, synth.Sine) and isinstance(m.inputs.get("frequency"), synth.Input)
+    ]
+
+
+def messure(modules):
+    t1 = time.ticks_us()
+    for _ in range(BLOCKS):
+        for module in modules:
+            module.update()
+    return time.ticks_diff(time.ticks_us(), t1) / BLOCKS
+
+
+SYNTH = build_patch()
+SYNTH.compile()
+oscillators = sines(SYNTH)
+inputs = [m.frequency_source for m in oscillators]
+size = SYNTH.base.buffer_size
+
+constant = messure(oscillators)
+free_buffers = sum(1 for m in inputs if m.buffer is None)
+
+t1 = time.ticks_us()
+for _ in range(BLOCKS):
+    inputs[0].set_value(440)
+set_constant = time.ticks_diff(time.ticks_us(), t1) / BLOCKS
+
+# The same Sines with their Inputs expanded into audio-rate buffers.
+for m in oscillators:
+    m.frequency_buffer = m.frequency_source.require_buffer()
+buffered = messure(oscillators)
+
+t1 = time.ticks_us()
+for _ in range(BLOCKS):
+    inputs[0].set_value(440)
+set_buffered = time.ticks_diff(time.ticks_us(), t1) / BLOCKS
+
+
+def legacy_set_value(module, value):
+    for i in range(size):
+        module.buffer[i] = value
+
+
+t1 = time.ticks_us()
+for _ in range(BLOCKS):
+    legacy_set_value(inputs[0], 440)
+set_legacy = time.ticks_diff(time.ticks_us(), t1) / BLOCKS
+
+print(f"{len(oscillators)} Sines on Inputs, {size} samples/block")
+print(f"constant frequency:  {constant:.1f} us/block")
+print(f"buffered frequency:  {buffered:.1f} us/block ({buffered / constant:.2f}x)")
+print(f"set_value constant:  {set_constant:.1f} us")
+print(f"set_value buffered:  {set_buffered:.1f} us (viper fill)")
+print(f"set_value legacy:    {set_legacy:.1f} us (Python loop)")
+print(f"Input buffers saved: {free_buffers} ({free_buffers * size * 2} bytes)")
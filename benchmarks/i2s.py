@@ -0,0 +1,72 @@
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+sys.path.insert(0, ".")
+
+import host
+
+host.install()
+
+from host.clock import CLOCK
+import audio
+import input
+import memory
+
+# Underruns of the two single-core speaker paths under a busy event loop:
+# the StreamWriter/drain() task against the I2S irq handler fed from a ring.
+# Host only; the fake I2S times DMA completion on the simulated clock.
+#
+#   python benchmarks/i2s.py --seconds 10 --busy-ms 30
+
+
+def run(mode, seconds, busy_ms, depth, seed):
+    random.seed(seed)
+    SYNTH = memory.build_patch()
+    SPEAKER = input.Speaker(buffer_size=600)
+
+    async def busy():
+        # Stand-in for UI work that holds the event loop.
+        while True:
+            CLOCK.sleep(random.randint(0, busy_ms) / 1000)
+            await asyncio.sleep_ms(10)
+
+    async def stream():
+        writer = asyncio.StreamWriter(SPEAKER.audio)
+        while True:
+            writer.write(SYNTH.get_buffer())
+            await writer.drain()
+
+    async def main():
+        asyncio.create_task(busy())
+        if mode == "irq":
+            engine = audio.AudioEngine(SYNTH, depth)
+            SPEAKER.start_irq(engine.ring)
+            asyncio.create_task(engine.render_task(SPEAKER))
+        else:
+            asyncio.create_task(stream())
+        await asyncio.sleep(seconds)
+        SPEAKER.audio.deinit()
+
+    start = time.time()
+    asyncio.run(main())
+    return SPEAKER.audio.underruns, time.time() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--busy-ms", type=int, default=30)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    for mode in ("stream", "irq"):
+        underruns, wall = run(mode, args.seconds, args.busy_ms, args.depth, args.seed)
+        print(f"{mode:6} underruns: {underruns:4}  ({wall:.1f}s wall)")
+
+
+if __name__ == "__main__":
+    main()
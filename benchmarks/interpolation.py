@@ -0,0 +1,67 @@
+import math
+import time
+import synth
+
+# Table size and read path of the Sine oscillator: SNR against an ideal sine
+# at the same phase, and render cost, for the truncating and interpolating
+# kernels. Runs on the device and under the host runtime.
+#
+#   mpremote cp synth.py : + run benchmarks/interpolation.py
+
+SIZES = [256, 1024]
+AMPLITUDES = [255, 16383]
+FREQUENCIES = [55, 440, 1760]
+BLOCKS = 20
+
+
+def build(size, interpolate, amplitude, frequency):
+    base = synth.Config()
+    base.lut_size = size
+    base.interpolate = interpolate
+    base.max = amplitude
+    SYNTH = synth.Synth(base)
+    source = SYNTH.add_module(synth.Input)
+    source.set_value(frequency)
+    sine = SYNTH.add_module(synth.Sine)
+    sine.set("frequency", source)
+    SYNTH.output.set("input", sine)
+    SYNTH.compile()
+    return sine
+
+
+def snr(size, interpolate, amplitude, frequency):
+    sine = build(size, interpolate, amplitude, frequency)
+    base = sine.base
+    increment = ((size << 16) // base.sample_rate) * frequency
+    signal = 0.0
+    noise = 0.0
+    for _ in range(BLOCKS):
+        # Follow the kernel's own 32-bit phase so only the table read is
+        # measured, not the quantized increment.
+        phase = sine.index
+        sine.update()
+        for value in sine.buffer:
+            ideal = amplitude * math.sin(2 * math.pi * phase / (size << 16))
+            signal += ideal * ideal
+            noise += (value - ideal) * (value - ideal)
+            phase = (phase + increment) & 0xFFFFFFFF
+    return 10 * math.log10(signal / max(noise, 1e-9))
+
+
+def cost(size, interpolate):
+    sine = build(size, interpolate, 255, 440)
+    t1 = time.ticks_us()
+    for _ in range(BLOCKS):
+        sine.update()
+    elapsed = time.ticks_diff(time.ticks_us(), t1)
+    return elapsed * 1000 / (BLOCKS * sine.base.buffer_size)
+
+
+for size in SIZES:
+    for interpolate in (False, True):
+        mode = "interpolated" if interpolate else "truncated"
+        print(f"{size:5} {mode:12} {cost(size, interpolate):8.0f} ns/sample")
+        for amplitude in AMPLITUDES:
+            results = [snr(size, interpolate, amplitude, f) for f in FREQUENCIES]
+            text = "  ".join(f"{f}Hz {r:5.1f}dB" for f, r in zip(FREQUENCIES, results))
+            print(f"      max {amplitude:5}: {text}")
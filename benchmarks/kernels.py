@@ -0,0 +1,155 @@
+import gc
+import json
+import sys
+import time
+import synth
+
+# ns/sample of every SynthModule's update() across buffer sizes and sample
+# rates. Runs unchanged on the device and on the host runtime; the result is
+# printed as one JSON line. Use benchmarks/run.py to drive it and compare
+# against a baseline.
+#
+# On the device the scenario list can be narrowed with a bench_config.json
+# next to the script (same keys as DEFAULTS).
+
+DEFAULTS = {
+    "modules": None,
+    "buffer_sizes": [50, 100, 200, 512, 1024],
+    "sample_rates": [8000, 16000, 22050, 44100],
+    "min_us": 20000,
+    "rounds": 5,
+}
+
+# Inputs to connect where get_input_names() does not list a fixed set.
+CONNECT = {
+    "Mixer": ["input0", "input1", "input1_volume"],
+}
+
+# Extra runs of a module with an option changed, as (setter, value).
+VARIANTS = {
+    "Noise": [("type", t) for t in synth.Noise.types],
+    "Envelope": [("curve", "exponential")],
+}
+
+
+def module_classes():
+    classes = []
+    for name in dir(synth):
+        cls = getattr(synth, name)
+        if (
+            isinstance(cls, type)
+            and issubclass(cls, synth.SynthModule)
+            and cls is not synth.SynthModule
+        ):
+            classes.append(cls)
+    return classes
+
+
+def build(cls, buffer_size, sample_rate, variant=None):
+    base = synth.Config()
+    base.buffer_size = buffer_size
+    base.sample_rate = sample_rate
+    SYNTH = synth.Synth(base)
+    module = SYNTH.add_module(cls)
+    if variant is not None:
+        getattr(module, "set_" + variant[0])(variant[1])
+
+    names = CONNECT.get(cls.__name__, module.get_input_names())
+    for name in names:
+        source = SYNTH.add_module(synth.Input)
+        if name == "frequency":
+            source.set_value(440)
+        elif name.endswith("_volume"):
+            source.set_value(base.max // 2)
+        else:
+            frequency = source
+            frequency.set_value(440)
+            source = SYNTH.add_module(synth.Sine)
+            source.set("frequency", frequency)
+        module.set(name, source)
+
+    if module is not SYNTH.output:
+        SYNTH.output.set("input", module)
+    if hasattr(module, "trigger_attack"):
+        module.trigger_attack()
+
+    # Render once so every source buffer holds real signal.
+    SYNTH.get_buffer()
+    return module
+
+
+def time_update(module, min_us, rounds):
+    update = module.update
+    repeats = 1
+    while True:
+        t1 = time.ticks_us()
+        for _ in range(repeats):
+            update()
+        elapsed = time.ticks_diff(time.ticks_us(), t1)
+        if elapsed >= min_us:
+            break
+        repeats *= 2
+
+    best = elapsed
+    for _ in range(rounds - 1):
+        t1 = time.ticks_us()
+        for _ in range(repeats):
+            update()
+        best = min(best, time.ticks_diff(time.ticks_us(), t1))
+
+    return best * 1000 / (repeats * module.base.buffer_size)
+
+
+def scenarios(config):
+    for cls in module_classes():
+        name = cls.__name__
+        if config["modules"] is not None and name not in config["modules"]:
+            continue
+        variants = [None] + VARIANTS.get(name, [])
+        for variant in variants:
+            label = name
+            if variant is not None:
+                label = f"{name}[{variant[0]}={variant[1]}]"
+            for buffer_size in config["buffer_sizes"]:
+                for sample_rate in config["sample_rates"]:
+                    yield label, cls, variant, buffer_size, sample_rate
+
+
+def run(config=None):
+    settings = dict(DEFAULTS)
+    if config:
+        settings.update(config)
+
+    results = {}
+    for label, cls, variant, buffer_size, sample_rate in scenarios(settings):
+        key = f"{label}@{buffer_size}/{sample_rate}"
+        gc.collect()
+        try:
+            module = build(cls, buffer_size, sample_rate, variant)
+        except NotImplementedError:
+            # Abstract base classes such as Oscillator.
+            continue
+        except MemoryError:
+            results[key] = None
+            continue
+        results[key] = time_update(module, settings["min_us"], settings["rounds"])
+        module = None
+
+    return {
+        "implementation": sys.implementation.name,
+        "platform": sys.platform,
+        "unit": "ns/sample",
+        "results": results,
+    }
+
+
+def load_config(path="bench_config.json"):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(load_config())))
@@ -0,0 +1,66 @@
+import gc
+import synth
+
+# Audio buffer memory for the patch built in main.py, with and without the
+# liveness-based buffer pool.
+#
+#   mpremote cp synth.py : + run benchmarks/memory.py
+
+
+def build_patch():
+    SYNTH = synth.Synth(synth.Config())
+    frequency_module = SYNTH.add_module(synth.Input)
+    frequency_module2 = SYNTH.add_module(synth.Input)
+    frequency_module3 = SYNTH.add_module(synth.Input)
+    volume_sine = SYNTH.add_module(synth.Sine)
+    base_sine = SYNTH.add_module(synth.Sine)
+    sine = SYNTH.add_module(synth.Sine)
+    mixer = SYNTH.add_module(synth.Mixer)
+    envelope = SYNTH.add_module(synth.Envelope)
+    lpf = SYNTH.add_module(synth.LowPassFilter)
+    hpf = SYNTH.add_module(synth.HighPassFilter)
+    SYNTH.add_module(synth.Noise)
+    shifter = SYNTH.add_module(synth.PitchShifter)
+
+    frequency_module3.set_value(1)
+    volume_sine.set("frequency", frequency_module3)
+    frequency_module2.set_value(443)
+    base_sine.set("frequency", frequency_module2)
+    frequency_module.set_value(440)
+    sine.set("frequency", frequency_module)
+
+    mixer.set("input0", sine)
+    mixer.set("input1", base_sine)
+    mixer.set("input1_volume", volume_sine)
+    shifter.set("input", mixer)
+    envelope.set("input", mixer)
+    lpf.set("input", envelope)
+    hpf.set("input", envelope)
+    SYNTH.output.set("input", lpf)
+    return SYNTH
+
+
+def mem_free():
+    try:
+        return gc.mem_free()
+    except AttributeError:
+        return None
+
+
+if __name__ == "__main__":
+    gc.collect()
+    free_before = mem_free()
+    SYNTH = build_patch()
+    SYNTH.compile()
+    gc.collect()
+    free_after = mem_free()
+
+    usage = SYNTH.memory_usage()
+    print(f"modules:            {usage['modules']}")
+    print(f"scheduled:          {len(SYNTH.plan)}")
+    print(f"physical buffers:   {usage['buffers']}")
+    print(f"buffer bytes:       {usage['bytes']}")
+    print(f"one per module:     {usage['unpooled_bytes']}")
+    print(f"saved:              {usage['saved_bytes']}")
+    if free_before is not None:
+        print(f"heap used by patch: {free_before - free_after}")
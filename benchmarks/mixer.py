@@ -0,0 +1,71 @@
+import time
+import synth
+
+# Mixer.update() for 2, 4 and 8 channels: the viper Q8 kernel against the
+# previous pure Python loop, with unity channels and with every channel
+# scaled by an audio-rate _volume input.
+#
+#   mpremote cp synth.py : + run benchmarks/mixer.py
+
+BLOCKS = 50
+CHANNELS = [2, 4, 8]
+
+
+class LegacyMixer(synth.Mixer):
+    def bind(self, silence):
+        channels = []
+        for name, module in self.inputs.items():
+            if name.endswith("_volume"):
+                continue
+            module_volume = self.inputs.get(name + "_volume", None)
+            if module_volume is not None:
+                module_volume = module_volume.require_buffer()
+            channels.append((module.require_buffer(), module_volume))
+        self.channels = channels
+
+    def update(self):
+        for i in range(self.base.buffer_size):
+            self.buffer[i] = 0
+
+        for module_buffer, module_volume in self.channels:
+            for i in range(self.base.buffer_size):
+                if module_volume is not None:
+                    self.buffer[i] += int(
+                        module_buffer[i] * module_volume[i] / self.base.max
+                    )
+                else:
+                    self.buffer[i] += module_buffer[i]
+
+
+def build(cls, channels, volume):
+    SYNTH = synth.Synth(synth.Config())
+    frequency = SYNTH.add_module(synth.Input)
+    frequency.set_value(220)
+    source = SYNTH.add_module(synth.Sine)
+    source.set("frequency", frequency)
+    mixer = SYNTH.add_module(cls)
+    for i in range(channels):
+        mixer.set(f"input{i}", source)
+        if volume:
+            mixer.set(f"input{i}_volume", source)
+    SYNTH.output.set("input", mixer)
+    SYNTH.get_buffer()
+    return mixer
+
+
+def messure(mixer):
+    t1 = time.ticks_us()
+    for _ in range(BLOCKS):
+        mixer.update()
+    return time.ticks_diff(time.ticks_us(), t1) / BLOCKS
+
+
+for volume in (False, True):
+    print("with _volume inputs" if volume else "unity channels")
+    for channels in CHANNELS:
+        legacy = messure(build(LegacyMixer, channels, volume))
+        viper = messure(build(synth.Mixer, channels, volume))
+        print(
+            f"  {channels} channels: legacy {legacy:8.0f} us  "
+            f"viper {viper:7.0f} us  ({legacy / viper:.1f}x)"
+        )
@@ -0,0 +1,30 @@
+import time
+import synth
+from benchmarks.memory import build_patch
+from host.engine import NumpyEngine, compare
+
+# Offline rendering speed of the main.py patch with the NumPy engine, and a
+# check of the engine against the device kernels. Host only:
+#
+#   python -m host benchmarks/offline.py
+
+SECONDS = 120
+BLOCKS = 40
+
+SYNTH = build_patch()
+for module in SYNTH.modules:
+    if isinstance(module, synth.Envelope):
+        module.trigger_attack()
+SYNTH.output.set_amplitude(20)
+
+for exact in (False, True):
+    print(f"exact={exact}")
+    for name, mismatches, max_diff in compare(SYNTH, BLOCKS, exact).values():
+        status = "ok" if mismatches == 0 else f"{mismatches} samples differ (max {max_diff})"
+        print(f"  {name:16} {status}")
+
+engine = NumpyEngine(SYNTH)
+t1 = time.perf_counter()
+out = engine.render_seconds(SECONDS)
+t2 = time.perf_counter()
+print(f"rendered {len(out) / SYNTH.base.sample_rate:.0f}s of audio in {(t2 - t1) * 1000:.1f} ms")
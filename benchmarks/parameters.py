@@ -0,0 +1,64 @@
+import time
+import synth
+
+# Worst-case stall of a settings change: the setter doing the whole rebuild
+# on the caller's thread against the longest ParameterService.step() slice
+# and the swap at the block boundary. The block deadline is what the audio
+# thread can spare.
+#
+#   mpremote cp synth.py : + run benchmarks/parameters.py
+
+BUDGET_US = 2000
+CHANGES = [
+    (synth.Square, "duty_cycle", [0.3, 0.7, 0.4]),
+    (synth.Envelope, "attack", [0.5, 0.8, 0.3]),
+    (synth.Output, "knee", [0.6, 0.9, 0.5]),
+    (synth.LowPassFilter, "cutoff", [500, 2000, 800]),
+]
+
+
+def build(cls):
+    SYNTH = synth.Synth(synth.Config())
+    module = SYNTH.output if cls is synth.Output else SYNTH.add_module(cls)
+    return SYNTH, module
+
+
+def direct(cls, name, values):
+    SYNTH, module = build(cls)
+    worst = 0
+    for value in values:
+        # Drop the shared tables so every change really rebuilds.
+        synth.LUTS = synth.LutCache()
+        t1 = time.ticks_us()
+        getattr(module, "set_" + name)(value)
+        worst = max(worst, time.ticks_diff(time.ticks_us(), t1))
+    return worst
+
+
+def background(cls, name, values):
+    SYNTH, module = build(cls)
+    service = SYNTH.enable_background_updates(BUDGET_US)
+    worst_step = worst_swap = steps = 0
+    for value in values:
+        synth.LUTS = synth.LutCache()
+        getattr(module, "set_" + name)(value)
+        while service.jobs:
+            t1 = time.ticks_us()
+            service.step()
+            worst_step = max(worst_step, time.ticks_diff(time.ticks_us(), t1))
+            steps += 1
+        t1 = time.ticks_us()
+        service.commit()
+        worst_swap = max(worst_swap, time.ticks_diff(time.ticks_us(), t1))
+    return worst_step, worst_swap, steps / len(values)
+
+
+base = synth.Config()
+print(f"block deadline {base.buffer_size * 1000000 // base.sample_rate} us")
+for cls, name, values in CHANGES:
+    stall = direct(cls, name, values)
+    step, swap, steps = background(cls, name, values)
+    print(
+        f"  {cls.__name__}.set_{name}: direct {stall:7} us  "
+        f"sliced max {step:5} us x {steps:4.1f}  swap {swap:4} us"
+    )
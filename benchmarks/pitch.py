@@ -0,0 +1,80 @@
+import math
+import time
+import synth
+
+# PitchShifter on a 233 Hz sine at several ratios: CPU per sample, the
+# output frequency from rising zero crossings and its error in cents, and
+# the level ripple from the crossfade between the heads. 233 Hz does not fit
+# the window a whole number of times, so every head jump lands off-phase;
+# that shows up as ripple and as a pull towards a neighbouring sideband.
+#
+#   mpremote cp synth.py : + run benchmarks/pitch.py
+
+FREQUENCY = 233
+RATIOS = [0.5, 0.75, 1.0, 1.25, 1.5, 2.0]
+SETTLE_BLOCKS = 4
+BLOCKS = 40
+
+
+def build(ratio):
+    SYNTH = synth.Synth(synth.Config())
+    frequency = SYNTH.add_module(synth.Input)
+    frequency.set_value(FREQUENCY)
+    source = SYNTH.add_module(synth.Sine)
+    source.set("frequency", frequency)
+    shifter = SYNTH.add_module(synth.PitchShifter)
+    shifter.set("input", source)
+    shifter.set_pitch(ratio)
+    SYNTH.output.set("input", shifter)
+    for _ in range(SETTLE_BLOCKS):
+        SYNTH.get_buffer()
+    return SYNTH, source, shifter
+
+
+def signed(value):
+    return value - 65536 if value > 32767 else value
+
+
+def zero_crossings(samples, sample_rate):
+    crossings = []
+    for i in range(1, len(samples)):
+        a = samples[i - 1]
+        b = samples[i]
+        if a < 0 <= b:
+            crossings.append(i - 1 + a / (a - b))
+    if len(crossings) < 2:
+        return 0
+    return (len(crossings) - 1) * sample_rate / (crossings[-1] - crossings[0])
+
+
+def ripple(samples, length):
+    # Smallest against largest peak over stretches of two periods, in dB.
+    peaks = []
+    for start in range(0, len(samples) - length + 1, length):
+        peaks.append(max(abs(x) for x in samples[start : start + length]))
+    if not peaks or min(peaks) == 0:
+        return -99.0
+    return 20 * math.log10(min(peaks) / max(peaks))
+
+
+for ratio in RATIOS:
+    SYNTH, source, shifter = build(ratio)
+    samples = []
+    elapsed = 0
+    for _ in range(BLOCKS):
+        source.update()
+        t1 = time.ticks_us()
+        shifter.update()
+        elapsed += time.ticks_diff(time.ticks_us(), t1)
+        samples.extend(signed(value) for value in shifter.read())
+    sample_rate = SYNTH.base.sample_rate
+    ns = elapsed * 1000 / len(samples)
+    measured = zero_crossings(samples, sample_rate)
+    expected = FREQUENCY * ratio
+    cents = 1200 * math.log(measured / expected, 2) if measured else 0
+    period = int(2 * sample_rate / expected)
+    print(
+        f"ratio {ratio:4.2f}: {ns:6.0f} ns/sample  "
+        f"{measured:6.1f} Hz (expected {expected:5.1f}, {cents:+5.0f} cents)  "
+        f"ripple {ripple(samples, period):5.1f} dB"
+    )
@@ -0,0 +1,137 @@
+import array
+import time
+import micropython
+import synth
+
+# Reverb.update() at 8, 16, 22.05 and 44.1 kHz: the flat delay-line kernel
+# against the previous one that indexed Python lists of buffers, indexes and
+# filter states for every comb and allpass on every sample. The previous
+# kernel always ran Freeverb's 44.1 kHz line lengths.
+#
+#   mpremote cp synth.py : + run benchmarks/reverb.py
+
+BLOCKS = 20
+SAMPLE_RATES = [8000, 16000, 22050, 44100]
+
+
+class LegacyReverb(synth.Reverb):
+    def __init__(self, base):
+        super().__init__(base)
+        self.comb_sizes = [1116, 1188, 1277, 1356, 1422, 1491, 1557, 1617]
+        self.comb_buffers = [array.array("h", [0] * s) for s in self.comb_sizes]
+        self.comb_indexes = [0] * 8
+        self.comb_filters = [0] * 8
+
+        self.allpass_sizes = [556, 441, 341, 225]
+        self.allpass_buffers = [array.array("h", [0] * s) for s in self.allpass_sizes]
+        self.allpass_indexes = [0] * 4
+
+    @micropython.viper
+    def update(self):
+        input_buf = ptr16(self.input_buffer)
+        buffer_size = uint(self.base.buffer_size)
+        buf = ptr16(self.buffer)
+
+        roomsize = int(self.roomsize_fp)
+        damp1 = int(self.damp1_fp)
+        damp2 = int(self.damp2_fp)
+        mix_dry = int(self.mix_dry)
+        mix_wet = int(self.mix_wet)
+
+        i = uint(0)
+        while i < buffer_size:
+            inp = int(input_buf[i])
+
+            comb_sum = 1
+            j = uint(0)
+            while j < uint(8):
+                b = ptr16(self.comb_buffers[j])
+                idx = uint(self.comb_indexes[j])
+                y = b[idx]
+                comb_sum += y
+
+                f = int(self.comb_filters[j])
+                if y > 32768:
+                    f1 = 65536 - ((65536 - y) * damp2) >> 15
+                else:
+                    f1 = (y * damp2) >> 15
+
+                if f > 32768:
+                    f2 = 65536 - ((65536 - f) * damp1) >> 15
+                else:
+                    f2 = (f * damp1) >> 15
+
+                self.comb_filters[j] = f1 + f2
+
+                if f > 32768:
+                    f3 = 65536 - ((65536 - f) * roomsize) >> 15
+                else:
+                    f3 = (f * roomsize) >> 15
+
+                b[idx] = inp + f3
+                self.comb_indexes[j] = int(idx + 1) % int(self.comb_sizes[j])
+                j += 1
+
+            if comb_sum > 32768:
+                out = 65536 - (((65536 - comb_sum) * 31457) >> 17)
+            else:
+                out = (comb_sum * 31457) >> 17
+
+            j = uint(0)
+            while j < uint(4):
+                b = ptr16(self.allpass_buffers[j])
+                idx = uint(self.allpass_indexes[j])
+                y = b[idx]
+                b[idx] = out + (y >> 1)
+                out = y - out
+                self.allpass_indexes[j] = int(idx + 1) % int(self.allpass_sizes[j])
+                self.allpass_buffers[j] = b
+                j += 1
+
+
+            if inp > 32768:
+                mixed1 = 65536 - (((65536 - inp) * mix_dry) >> 15)
+            else:
+                mixed1 = (inp * mix_dry) >> 15
+
+            if out > 32768:
+                mixed2 = 65536 - (((65536 - out) * mix_wet) >> 15)
+            else:
+                mixed2 = (out * mix_wet) >> 15
+
+            buf[i] = mixed1 + mixed2
+            i += 1
+
+
+def build(cls, sample_rate):
+    base = synth.Config()
+    base.sample_rate = sample_rate
+    SYNTH = synth.Synth(base)
+    frequency = SYNTH.add_module(synth.Input)
+    frequency.set_value(220)
+    source = SYNTH.add_module(synth.Sawtooth)
+    source.set("frequency", frequency)
+    reverb = SYNTH.add_module(cls)
+    reverb.set("input", source)
+    SYNTH.output.set("input", reverb)
+    SYNTH.get_buffer()
+    return reverb
+
+
+def messure(reverb):
+    t1 = time.ticks_us()
+    for _ in range(BLOCKS):
+        reverb.update()
+    elapsed = time.ticks_diff(time.ticks_us(), t1)
+    return elapsed * 1000 / (BLOCKS * reverb.base.buffer_size)
+
+
+for sample_rate in SAMPLE_RATES:
+    legacy = messure(build(LegacyReverb, sample_rate))
+    flat = build(synth.Reverb, sample_rate)
+    current = messure(flat)
+    print(
+        f"{sample_rate:5} Hz: legacy {legacy:7.0f} ns/sample  "
+        f"flat {current:7.0f} ns/sample  ({legacy / current:.1f}x)  "
+        f"lines {len(flat.lines) * 2} bytes"
+    )
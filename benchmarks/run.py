@@ -0,0 +1,150 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# Runs benchmarks/kernels.py on the host runtime or on a device via mpremote,
+# writes the results as JSON and compares them with a saved baseline. Any
+# scenario slower than the baseline by more than --threshold fails the run.
+#
+# Timings only compare on the machine that made them, so no baseline is
+# shipped: save one on a clean tree first, then check changes against it.
+# With --check a missing baseline fails the run instead of just listing the
+# results.
+#
+#   python benchmarks/run.py --save-baseline
+#   python benchmarks/run.py --check
+#   python benchmarks/run.py --device /dev/ttyACM0 --modules Sine,Mixer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINES = os.path.join(ROOT, "benchmarks", "baselines")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="benchmarks/run.py")
+    parser.add_argument("--device", default=None,
+                        help="serial port to run on through mpremote")
+    parser.add_argument("--modules", default=None, help="comma separated classes")
+    parser.add_argument("--buffer-sizes", default=None)
+    parser.add_argument("--sample-rates", default=None)
+    parser.add_argument("--output", default=None, help="write results here")
+    parser.add_argument("--baseline", default=None,
+                        help="baseline file (default: baselines/<target>.json)")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true",
+                        help="fail when there is no baseline to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed slowdown as a fraction")
+    return parser.parse_args(argv)
+
+
+def build_config(args):
+    config = {}
+    if args.modules:
+        config["modules"] = args.modules.split(",")
+    if args.buffer_sizes:
+        config["buffer_sizes"] = [int(v) for v in args.buffer_sizes.split(",")]
+    if args.sample_rates:
+        config["sample_rates"] = [int(v) for v in args.sample_rates.split(",")]
+    return config
+
+
+def run_host(config):
+    sys.path.insert(0, ROOT)
+    import host
+
+    host.install()
+    from benchmarks import kernels
+
+    return kernels.run(config)
+
+
+def run_device(port, config):
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump(config, f)
+        config_path = f.name
+
+    command = [
+        "mpremote", "connect", port,
+        "cp", os.path.join(ROOT, "synth.py"), ":synth.py", "+",
+        "cp", config_path, ":bench_config.json", "+",
+        "run", os.path.join(ROOT, "benchmarks", "kernels.py"), "+",
+        "rm", ":bench_config.json",
+    ]
+    try:
+        output = subprocess.run(
+            command, check=True, capture_output=True, text=True
+        ).stdout
+    finally:
+        os.unlink(config_path)
+
+    for line in reversed(output.splitlines()):
+        if line.startswith("{"):
+            return json.loads(line)
+    raise RuntimeError(f"No results in mpremote output:\n{output}")
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for key, value in sorted(results["results"].items()):
+        previous = baseline["results"].get(key, None)
+        if value is None or previous is None:
+            print(f"{key:40} {value if value is not None else '-':>10}")
+            continue
+        ratio = value / previous
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        print(f"{key:40} {value:10.1f} {previous:10.1f} {ratio:6.2f}x{flag}")
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = build_config(args)
+    if args.device is None:
+        target = "host"
+        results = run_host(config)
+    else:
+        target = "device"
+        results = run_device(args.device, config)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+    baseline_path = args.baseline or os.path.join(BASELINES, f"{target}.json")
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        baseline = {"results": {}}
+        if os.path.exists(baseline_path):
+            with open(baseline_path) as f:
+                baseline = json.load(f)
+        baseline.update({k: v for k, v in results.items() if k != "results"})
+        baseline["results"].update(results["results"])
+        with open(baseline_path, "w") as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        print(f"saved {len(results['results'])} results to {baseline_path}")
+        return 0
+
+    if not os.path.exists(baseline_path):
+        for key, value in sorted(results["results"].items()):
+            print(f"{key:40} {value}")
+        print(f"no baseline at {baseline_path}; run with --save-baseline")
+        return 1 if args.check else 0
+
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} scenarios slower than baseline by more than "
+              f"{args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+import time
+import synth
+
+# Per-block graph overhead on a 20-module patch: the recursive read()/reset()
+# walk that Synth.get_buffer() used to do against the compiled plan.
+# Modules do no DSP work so only the scheduling cost is measured.
+#
+#   mpremote cp synth.py : + run benchmarks/schedule.py
+
+BLOCKS = 1000
+MODULES = 20
+
+
+class Node(synth.SynthModule):
+    def __init__(self, base):
+        super().__init__(base)
+        self.is_updated = False
+
+    def get_input_names(self):
+        return ["input0", "input1"]
+
+    def update(self):
+        pass
+
+
+def legacy_read(module):
+    if not module.is_updated:
+        for m in module.inputs.values():
+            legacy_read(m)
+        module.update()
+        module.is_updated = True
+    return module.buffer
+
+
+def legacy_reset(module):
+    if module.is_updated:
+        module.is_updated = False
+        for m in module.inputs.values():
+            legacy_reset(m)
+
+
+def build_patch():
+    SYNTH = synth.Synth(synth.Config())
+    SYNTH.output.is_updated = False
+    nodes = [SYNTH.add_module(Node) for _ in range(MODULES - 1)]
+    for i, node in enumerate(nodes):
+        if i >= 1:
+            node.set("input0", nodes[i - 1])
+        if i >= 2:
+            node.set("input1", nodes[i - 2])
+    SYNTH.output.update = lambda: None
+    SYNTH.output.set("input", nodes[-1])
+    return SYNTH
+
+
+def messure(name, fn):
+    t1 = time.ticks_us()
+    for _ in range(BLOCKS):
+        fn()
+    t2 = time.ticks_us()
+    per_block = time.ticks_diff(t2, t1) / BLOCKS
+    print(f"{name}: {per_block:.1f} us/block")
+    return per_block
+
+
+SYNTH = build_patch()
+
+
+def legacy_block():
+    legacy_read(SYNTH.output)
+    legacy_reset(SYNTH.output)
+
+
+SYNTH.compile()
+before = messure("recursive pull/reset", legacy_block)
+after = messure("compiled plan", SYNTH.get_buffer)
+print(f"{len(SYNTH.plan)} scheduled modules, overhead ratio {before / after:.1f}x")
@@ -3,8 +3,13 @@ from machine import Pin, SPI
 from sysfont import sysfont
 import synth
 import array
+import gc
 import random
 import math
+import time
+
+# Heap bytes add_module leaves free after a new module is allocated.
+MEMORY_RESERVE = 8192
 
 
 class Display(TFT):
@@ -104,6 +109,7 @@ class Window:
         # New_Module_Menu
         # Module_map
         # Module_settings
+        # Profiler
         self.display_state = "Graph"
         self.size = [160, 128]
         self.update_buffer = False
@@ -124,6 +130,7 @@ class Window:
         self.last_encoder_pressed = False
         self.module_map_pos = {}
         self.module_map_grid = []
+        self.last_profile_draw = 0
         self.all_modules = {
             "Input": synth.Input,
             "Noise": synth.Noise,
@@ -136,7 +143,11 @@ class Window:
             "Envelope": synth.Envelope,
             "LowPassFilter": synth.LowPassFilter,
             "HighPassFilter": synth.HighPassFilter,
+            "StateVariableFilter": synth.StateVariableFilter,
             "Reverb": synth.Reverb,
+            "Delay": synth.Delay,
+            "Chorus": synth.Chorus,
+            "VoiceManager": synth.VoiceManager,
         }
 
         self.color_legend = {
@@ -151,48 +162,57 @@ class Window:
             "Envelope": self.tft.color(138, 43, 226),
             "LowPassFilter": self.tft.BLUE,
             "HighPassFilter": self.tft.color(0, 20, 255),
+            "StateVariableFilter": self.tft.color(0, 100, 255),
             "Output": self.tft.RED,
             "Reverb": self.tft.WHITE,
+            "Delay": self.tft.color(200, 200, 200),
+            "Chorus": self.tft.color(255, 105, 180),
+            "VoiceManager": self.tft.color(0, 255, 128),
         }
 
     def display(self):
         while True:
-            if self.display_state == "Graph":
-                if self.update_buffer:
-                    self.tft.draw_buffer(self.buffer)
-                    self.update_buffer = False
-            elif self.display_state == "Module_Menu":
-                self.modules_menu()
-            elif self.display_state == "New_Module_Menu":
-                if not self.init_menu:
-                    self.draw_str_list(self.all_modules.keys())
-                    self.init_menu = True
-                    self.steps[0] = len(self.all_modules)
-                self.select_new_menu()
-            elif self.display_state == "Module_map":
-                if not self.init_menu and self.modules() != []:
-                    self.draw_module_map()
-                    self.init_menu = True
-                self.select_module_in_map()
-            elif self.display_state == "Module_settings":
-                if not self.init_menu:
-                    self.init_menu = True
-                    self.draw_module_settings()
-                    self.last_setting_index = self.current_setting_index
-                    self.last_pot_states = self.pot_states[:]
-
-                self.handle_module_settings_input()
-
-                # Only redraw if something changed
-                if (
-                    self.current_setting_index != self.last_setting_index
-                    or self.encoder_position != self.last_encoder_position
-                    or self.encoder_pressed != self.last_encoder_pressed
-                ):
-                    self.draw_module_settings()
-                    self.last_setting_index = self.current_setting_index
-                    self.last_encoder_position = self.encoder_position
-                    self.last_encoder_pressed = self.encoder_pressed
+            self.display_step()
+
+    def display_step(self):
+        if self.display_state == "Graph":
+            if self.update_buffer:
+                self.tft.draw_buffer(self.buffer)
+                self.update_buffer = False
+        elif self.display_state == "Module_Menu":
+            self.modules_menu()
+        elif self.display_state == "New_Module_Menu":
+            if not self.init_menu:
+                self.draw_str_list(self.all_modules.keys())
+                self.init_menu = True
+                self.steps[0] = len(self.all_modules)
+            self.select_new_menu()
+        elif self.display_state == "Module_map":
+            if not self.init_menu and self.modules() != []:
+                self.draw_module_map()
+                self.init_menu = True
+            self.select_module_in_map()
+        elif self.display_state == "Module_settings":
+            if not self.init_menu:
+                self.init_menu = True
+                self.draw_module_settings()
+                self.last_setting_index = self.current_setting_index
+                self.last_pot_states = self.pot_states[:]
+
+            self.handle_module_settings_input()
+
+            # Only redraw if something changed
+            if (
+                self.current_setting_index != self.last_setting_index
+                or self.encoder_position != self.last_encoder_position
+                or self.encoder_pressed != self.last_encoder_pressed
+            ):
+                self.draw_module_settings()
+                self.last_setting_index = self.current_setting_index
+                self.last_encoder_position = self.encoder_position
+                self.last_encoder_pressed = self.encoder_pressed
+        elif self.display_state == "Profiler":
+            self.draw_profiler()
 
     def set_buffer(self, buffer):
         if not self.update_buffer:
@@ -215,14 +235,27 @@ class Window:
         module_keys = list(self.all_modules.keys())
         if 0 <= self.selected_module < len(module_keys):
             module_class = self.all_modules[module_keys[self.selected_module]]
+            if not self.fits_in_memory(module_class):
+                print(f"Not enough memory for {module_class.__name__}")
+                return None
             new_module = self.synth.add_module(module_class)
             # Redraw module map to include new module
             self.draw_module_map()
             return new_module
         return None
 
+    def fits_in_memory(self, module_class):
+        # Keep some heap free for the buffers a recompile allocates.
+        gc.collect()
+        try:
+            free = gc.mem_free()
+        except AttributeError:
+            return True
+        cost = module_class.memory_cost(self.synth.base)
+        return cost + MEMORY_RESERVE <= free
+
     def delete_module(self, module):
-        del self.synth.modules[module.id]
+        self.synth.remove_module(module)
 
     def select_new_menu(self, pos=10, distance=10, margin=10, circle_size_prozent=0.25):
         # Use encoder position to select modules, with bounds checking
@@ -497,12 +530,30 @@ class Window:
             if current_option == "duty_cycle":
                 # Duty cycle: 0.0 to 1.0
                 new_value = adjustment_value / 100.0
-            elif current_option in ["attack", "decay", "sustain", "release"]:
-                # Envelope parameters: 0.0 to 2.0
-                new_value = (adjustment_value / 100.0) * 2.0
+            elif current_option in ["attack", "decay", "release"]:
+                # Envelope times: 0.02 to 2.0 s
+                new_value = 0.02 + (adjustment_value / 100.0) * 1.98
+            elif current_option == "sustain":
+                # Envelope sustain level: 0.0 to 1.0
+                new_value = adjustment_value / 100.0
+            elif current_option == "mode":
+                modes = type(self.settings_module).modes
+                new_value = modes[adjustment_value % len(modes)]
+            elif current_option == "curve":
+                new_value = ["linear", "exponential"][adjustment_value % 2]
             elif current_option in ["cutoff"]:
                 # Filter cutoff: 20 to 4000 Hz
                 new_value = 20 + (adjustment_value / 100.0) * 3980
+            elif current_option == "time":
+                # Delay time: up to the line's maximum
+                max_time = self.settings_module.max_time
+                new_value = max(adjustment_value / 100.0 * max_time, 0.01)
+            elif current_option == "rate":
+                # Chorus LFO: 0.05 to 5 Hz
+                new_value = 0.05 + (adjustment_value / 100.0) * 4.95
+            elif current_option == "feedback":
+                # Delay feedback: 0.0 to 0.95
+                new_value = adjustment_value / 100.0 * 0.95
             elif current_option in ["roomsize", "damp", "mix"]:
                 # Reverb parameters: 0.0 to 1.0
                 new_value = adjustment_value / 100.0
@@ -514,19 +565,23 @@ class Window:
                 new_value = (adjustment_value / 100.0) * 2.0
             elif current_option == "type":
                 # Noise type: select from available types
-                noise_types = [
-                    "white",
-                    "pink",
-                    "red",
-                    "violet",
-                    "blue",
-                    "gray",
-                    "black",
-                ]
+                noise_types = synth.Noise.types
                 type_index = max(
                     0, min(adjustment_value % len(noise_types), len(noise_types) - 1)
                 )
                 new_value = noise_types[type_index]
+            elif current_option == "voices":
+                # Polyphony: 1 to 8 voices, chorus taps: 1 to 4
+                if isinstance(self.settings_module, synth.Chorus):
+                    most = synth.CHORUS_VOICES
+                else:
+                    most = 8
+                new_value = 1 + adjustment_value * (most - 1) // 100
+            elif current_option == "seed":
+                # Noise seed: 1 to 100
+                new_value = 1 + adjustment_value % 100
+            elif current_option == "stealing":
+                new_value = ["oldest", "quietest"][adjustment_value % 2]
             elif current_option == "value":
                 # Input value: -255 to 255
                 new_value = int(-255 + (adjustment_value / 100.0) * 510)
@@ -548,6 +603,46 @@ class Window:
             self.init_menu = False  # Reset init_menu for next time
             self.tft.clear()
 
+    def draw_profiler(self, interval=500, bar_x=52):
+        """Draw per-module render time as bars against the block deadline"""
+        now = time.ticks_ms()
+        if time.ticks_diff(now, self.last_profile_draw) < interval:
+            return
+        self.last_profile_draw = now
+
+        self.tft.fillrect((0, 0), self.size, self.tft.BLACK)
+        profile = self.synth.get_profile()
+        if profile is None or not profile["modules"]:
+            self.tft.text((10, 10), "Profiling off", self.tft.WHITE, sysfont)
+            return
+
+        deadline = profile["deadline"]
+        low, mean, high = profile["block"]
+        color = self.tft.RED if high > deadline else self.tft.WHITE
+        header = f"CPU {mean * 100 // deadline}% max {high * 100 // deadline}%"
+        reduction = self.synth.output.get_gain_reduction()
+        if reduction < -0.5:
+            header += f" GR {reduction:.0f}dB"
+        self.tft.text(
+            (2, 2),
+            header,
+            color,
+            sysfont,
+        )
+
+        bar_width = self.size[0] - bar_x - 2
+        y = 14
+        for module_id, name, low, mean, high in profile["modules"]:
+            if y > self.size[1] - 8:
+                break
+            color = self.color_legend.get(name, self.tft.WHITE)
+            self.tft.text((2, y), name[:8], color, sysfont)
+            width = min(bar_width, mean * bar_width // deadline)
+            self.tft.fillrect((bar_x, y), (max(1, width), 6), color)
+            peak = min(bar_width - 1, high * bar_width // deadline)
+            self.tft.vline((bar_x + peak, y), 7, self.tft.WHITE)
+            y += 9
+
     def draw_str_list(self, list, pos=10, distance=10, margin=10):
         for i, text in enumerate(list):
             f = (i + 1) * distance
@@ -0,0 +1,150 @@
+import asyncio
+import builtins
+import sys
+import time
+
+from host.clock import CLOCK
+from host import machine, micropython, thread
+
+# Host runtime for running the firmware under CPython. install() makes
+# ``micropython``, ``machine`` and ``_thread`` importable, adds the viper
+# builtins and the MicroPython-only parts of ``time`` and ``asyncio``. All
+# device time runs on CLOCK so a simulation can go faster than real time.
+
+_installed = False
+_asyncio_sleep = asyncio.sleep
+
+
+def ticks_ms():
+    return int(CLOCK.now() * 1000)
+
+
+def ticks_us():
+    return int(CLOCK.now() * 1_000_000)
+
+
+def ticks_cpu():
+    return ticks_us()
+
+
+def ticks_diff(ticks1, ticks2):
+    return ticks1 - ticks2
+
+
+def ticks_add(ticks, delta):
+    return ticks + delta
+
+
+def sleep(seconds):
+    CLOCK.sleep(seconds)
+
+
+def sleep_ms(ms):
+    CLOCK.sleep(ms / 1000)
+
+
+def sleep_us(us):
+    CLOCK.sleep(us / 1_000_000)
+
+
+async def async_sleep(delay, result=None):
+    return await _asyncio_sleep(CLOCK.real(delay), result)
+
+
+async def async_sleep_ms(ms):
+    await _asyncio_sleep(CLOCK.real(ms / 1000))
+
+
+class bytearray(builtins.bytearray):
+    """Stores into a MicroPython bytearray keep the low byte instead of raising."""
+
+    def __setitem__(self, index, value):
+        if isinstance(value, int):
+            value &= 0xFF
+        super().__setitem__(index, value)
+
+
+class StreamWriter:
+    """MicroPython's asyncio.StreamWriter over a blocking device like I2S."""
+
+    def __init__(self, s, extra=None):
+        self.s = s
+        self.out_buf = b""
+
+    def write(self, buf):
+        self.out_buf += bytes(buf)
+
+    async def drain(self):
+        if not self.out_buf:
+            return
+        delay = getattr(self.s, "delay", None)
+        if delay is not None:
+            await async_sleep(delay(len(self.out_buf)))
+        self.s.write(self.out_buf)
+        self.out_buf = b""
+
+    async def awrite(self, buf, off=0, sz=-1):
+        if sz == -1:
+            sz = len(buf) - off
+        self.write(memoryview(buf)[off : off + sz])
+        await self.drain()
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+
+class ThreadSafeFlag:
+    """asyncio.ThreadSafeFlag: set from an IRQ or another thread, awaited by one task."""
+
+    def __init__(self):
+        self._event = None
+        self._loop = None
+        self._pending = False
+
+    def set(self):
+        if self._loop is None:
+            self._pending = True
+        else:
+            self._loop.call_soon_threadsafe(self._event.set)
+
+    def clear(self):
+        self._pending = False
+        if self._event is not None:
+            self._event.clear()
+
+    async def wait(self):
+        if self._event is None:
+            self._event = asyncio.Event()
+            if self._pending:
+                self._event.set()
+            self._loop = asyncio.get_running_loop()
+        await self._event.wait()
+        self._event.clear()
+
+
+def install(speed=1.0):
+    global _installed
+    CLOCK.reset(speed)
+    if _installed:
+        return
+
+    for name in ("ptr8", "ptr16", "ptr32", "uint"):
+        setattr(builtins, name, getattr(micropython, name))
+    builtins.bytearray = bytearray
+
+    for func in (ticks_ms, ticks_us, ticks_cpu, ticks_diff, ticks_add,
+                 sleep, sleep_ms, sleep_us):
+        setattr(time, func.__name__, func)
+
+    asyncio.sleep = async_sleep
+    asyncio.sleep_ms = async_sleep_ms
+    asyncio.StreamWriter = StreamWriter
+    asyncio.ThreadSafeFlag = ThreadSafeFlag
+
+    sys.modules["micropython"] = micropython
+    sys.modules["machine"] = machine
+    sys.modules["_thread"] = thread
+    _installed = True
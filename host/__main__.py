@@ -0,0 +1,77 @@
+import argparse
+import _thread
+import os
+import runpy
+import sys
+import threading
+
+import host
+from host.clock import CLOCK
+from host.machine import I2S, SPI
+from host.sinks import FrameCapture, WavSink
+from host.timeline import Timeline
+
+# Run firmware headless on the host:
+#
+#   python -m host main.py --seconds 5 --wav out.wav --frames frames \
+#       --timeline timeline.json
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m host")
+    parser.add_argument("script", nargs="?", default="main.py")
+    parser.add_argument("--seconds", type=float, default=None,
+                        help="stop after this much device time")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="device seconds per host second")
+    parser.add_argument("--wav", default=None, help="write I2S 0 to this WAV file")
+    parser.add_argument("--frames", default=None, help="save TFT frames here")
+    parser.add_argument("--frame-interval", type=float, default=0.5)
+    parser.add_argument("--dc", type=int, default=4, help="TFT data/command pin")
+    parser.add_argument("--timeline", default=None, help="scripted input events")
+    parser.add_argument("--encoder", default="26,27", help="encoder A,B pins")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    host.install(args.speed)
+
+    wav = None
+    if args.wav is not None:
+        wav = WavSink(args.wav)
+        I2S.sinks[0] = wav
+
+    frames = None
+    if args.frames is not None:
+        frames = FrameCapture(args.frames, dc=args.dc, interval=args.frame_interval)
+        SPI.captures[0] = frames
+
+    if args.timeline is not None:
+        encoder = tuple(int(pin) for pin in args.encoder.split(","))
+        Timeline.load(args.timeline, encoder).start()
+
+    if args.seconds is not None:
+        timer = threading.Timer(CLOCK.real(args.seconds), _thread.interrupt_main)
+        timer.daemon = True
+        timer.start()
+
+    script = os.path.abspath(args.script)
+    sys.path[:0] = [os.getcwd(), os.path.dirname(script)]
+    sys.argv = [script]
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"simulated {CLOCK.now():.2f}s")
+        if wav is not None:
+            wav.close()
+            print(f"audio: {wav.bytes} bytes -> {wav.path}")
+        if frames is not None:
+            frames.save()
+            print(f"frames: {frames.frames} -> {frames.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import time
+
+_perf_counter = time.perf_counter
+_sleep = time.sleep
+
+
+class Clock:
+    """Virtual device time that runs ``speed`` times faster than the host."""
+
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self.origin = _perf_counter()
+
+    def reset(self, speed=None):
+        if speed is not None:
+            if speed <= 0:
+                raise ValueError("Speed must be greater than 0")
+            self.speed = speed
+        self.origin = _perf_counter()
+
+    def now(self):
+        return (_perf_counter() - self.origin) * self.speed
+
+    def real(self, seconds):
+        return seconds / self.speed
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            _sleep(seconds / self.speed)
+
+
+CLOCK = Clock()
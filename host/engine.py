@@ -0,0 +1,428 @@
+import array
+import copy
+
+import numpy as np
+
+import synth
+
+# Offline NumPy engine for a synth.Synth graph. It renders the same modules
+# with the same state (phase indexes, envelope counters, ...) as the device
+# kernels, so a patch can be rendered far faster than real time and used as a
+# reference for the viper code.
+#
+# Bit-exact with the int16 device semantics (unsigned ptr16 reads, stores
+# truncated to 16 bits, wrapping 32-bit phase accumulators):
+#   Input, Oscillator subclasses, Mixer, Output, Envelope
+#
+# Vectorized approximations (exact=False, the default):
+#   LowPassFilter, HighPassFilter: the signed one-pole recurrences the kernels
+#     implement, in floating point. They differ from the device by rounding
+#     and wherever the kernels' unsigned wraparound handling kicks in.
+#   Reverb: floating point Freeverb with the module's line lengths and
+#     parameters. It differs from the device by rounding and wherever the
+#     kernel saturates a delay line.
+#
+# With exact=True those modules, and any module this engine has no
+# vectorized kernel for, run their device update() block by block instead.
+# That needs the host runtime (host.install()) and is only as fast as the
+# kernel under CPython. Noise, StateVariableFilter, Delay and Chorus have no
+# vectorized kernel: the xorshift generator, the colour filters, the
+# fixed-point SVF and the delay feedback loops are sequential, so they always
+# run that way. PitchShifter has no vectorized kernel either.
+#
+# Renders always cover whole device blocks, so triggering an envelope between
+# render() calls behaves exactly as it would between two get_buffer() calls.
+
+MASK16 = 0xFFFF
+MASK32 = 0xFFFFFFFF
+
+
+def unsigned(x):
+    """A ptr16 read: the 16-bit pattern as 0..65535."""
+    return np.asarray(x).astype(np.int64) & MASK16
+
+
+def store(x):
+    """A ptr16 store: keep the low 16 bits, seen as int16."""
+    return (np.asarray(x, dtype=np.int64) & MASK16).astype(np.uint16).view(np.int16)
+
+
+def table(buffer):
+    return np.frombuffer(bytes(buffer), dtype=np.int16)
+
+
+def shared_tables():
+    """deepcopy memo that keeps the read-only synth.LUTS tables shared."""
+    memo = {}
+    for entry in synth.LUTS.tables.values():
+        tables = entry[0] if isinstance(entry[0], tuple) else (entry[0],)
+        for t in tables:
+            memo[id(t)] = t
+        memo[id(entry[0])] = entry[0]
+    return memo
+
+
+def one_pole(b, a, y0=0.0):
+    """y[n] = a * y[n - 1] + b[n], vectorized over chunks."""
+    b = np.asarray(b, dtype=np.float64)
+    if a == 0:
+        return b.copy()
+
+    # a ** -chunk has to stay well inside the float64 range.
+    chunk = int(min(4096, max(1, 250 / max(1e-12, -np.log10(abs(a))))))
+    powers = a ** np.arange(1, chunk + 1, dtype=np.float64)
+    y = np.empty(len(b))
+    for start in range(0, len(b), chunk):
+        segment = b[start : start + chunk]
+        p = powers[: len(segment)]
+        y[start : start + len(segment)] = p * (y0 + np.cumsum(segment / p))
+        y0 = y[start + len(segment) - 1]
+    return y
+
+
+class NumpyEngine:
+    def __init__(self, synth_instance, exact=False):
+        self.synth = synth_instance
+        self.exact = exact
+        self.state = {}
+        self.kernels = [
+            (synth.Input, self.input),
+            (synth.Oscillator, self.oscillator),
+            (synth.Mixer, self.mixer),
+            (synth.Output, self.output),
+            (synth.Envelope, self.envelope),
+            (synth.LowPassFilter, self.low_pass),
+            (synth.HighPassFilter, self.high_pass),
+            (synth.Reverb, self.reverb),
+        ]
+        self.approximate = (synth.LowPassFilter, synth.HighPassFilter, synth.Reverb)
+
+    def blocks(self, samples):
+        buffer_size = self.synth.base.buffer_size
+        return -(-samples // buffer_size)
+
+    def get_kernel(self, module):
+        if self.exact and isinstance(module, self.approximate):
+            return self.device
+        for cls, kernel in self.kernels:
+            if isinstance(module, cls):
+                return kernel
+        return self.device
+
+    def render(self, samples, modules=False):
+        """Render at least ``samples`` samples (whole blocks) of the output.
+
+        With ``modules=True`` a dict of every module's output keyed by module
+        ID is returned instead.
+        """
+        n = self.blocks(samples) * self.synth.base.buffer_size
+        order = self.synth.sort_modules(self.synth.output)
+        outputs = {}
+        for module in order:
+            inputs = {
+                name: outputs[str(m.get_id())] for name, m in module.inputs.items()
+            }
+            kernel = self.get_kernel(module)
+            outputs[str(module.get_id())] = kernel(module, inputs, n)
+
+        if modules:
+            return outputs
+        return outputs[str(self.synth.output.get_id())]
+
+    def render_seconds(self, seconds):
+        return self.render(int(seconds * self.synth.base.sample_rate))
+
+    def input(self, module, inputs, n):
+        if module.buffer is None:
+            return store(np.full(n, module.value))
+        return np.resize(table(module.buffer), n)
+
+    def _lookup(self, module, steps, n, levels=None):
+        # Phase of sample i is the index before it plus all earlier steps,
+        # all modulo 2**32 like the viper uint accumulator.
+        steps = np.broadcast_to(np.asarray(steps, dtype=np.uint64), (n,))
+        phase = np.cumsum(steps, dtype=np.uint64)
+        start = np.uint64(int(module.index) & MASK32)
+        before = (start + phase - steps) & np.uint64(MASK32)
+        module.index = int((start + phase[-1]) & np.uint64(MASK32))
+
+        lut = table(module.lut)
+        mod = np.uint64(len(lut) - 1)
+        index = ((before >> np.uint64(16)) & mod).astype(np.int64)
+        if levels is None:
+            luts, levels = lut[np.newaxis], 0
+        else:
+            luts = np.stack([table(t) for t in module.mipmap])
+        if not getattr(module, "interpolate", False):
+            return luts[levels, index]
+
+        a = luts[levels, index].astype(np.int64)
+        b = luts[levels, (index + 1) & int(mod)].astype(np.int64)
+        fraction = ((before >> np.uint64(8)) & np.uint64(0xFF)).astype(np.int64)
+        return store(a + (((b - a) * fraction) >> 8))
+
+    def _increment(self, module):
+        return (int(module.lut_amount) << 16) // int(module.base.sample_rate)
+
+    def oscillator(self, module, inputs, n):
+        frequency = inputs.get("frequency", np.zeros(n, dtype=np.int16))
+        steps = (self._increment(module) * unsigned(frequency)) & MASK32
+        if not isinstance(module, synth.WavetableOscillator):
+            return self._lookup(module, steps, n)
+
+        # The device picks a mipmap level per block from its first sample.
+        size = module.base.buffer_size
+        levels = [module.get_level(int(frequency[i])) for i in range(0, n, size)]
+        module.lut = module.mipmap[levels[-1]]
+        return self._lookup(module, steps, n, np.repeat(levels, size)[:n])
+
+    def mixer(self, module, inputs, n):
+        # Q8 gains into a 32-bit bus, saturated once, like Mixer._add().
+        bus = np.zeros(n, dtype=np.int64)
+        scale = (256 << 8) // module.base.max
+        for name, buffer in inputs.items():
+            if name.endswith("_volume"):
+                continue
+            values = buffer.astype(np.int64)
+            volume = module.inputs.get(name + "_volume", None)
+            if volume is None:
+                gain = 256
+            elif volume.constant:
+                gain = volume.value * 256 // module.base.max
+            else:
+                gain = (inputs[name + "_volume"].astype(np.int64) * scale) >> 8
+            bus += (values * gain) >> 8
+        # Output reads the bus before saturation.
+        self.state[("bus", str(module.get_id()))] = bus
+        return np.clip(bus, -32768, 32767).astype(np.int16)
+
+    def output(self, module, inputs, n):
+        source = module.inputs.get("input", None)
+        x = None
+        if getattr(source, "bus", None) is not None:
+            x = self.state.get(("bus", str(source.get_id())), None)
+        if x is None:
+            x = inputs.get("input", np.zeros(n, dtype=np.int16)).astype(np.int64)
+
+        x = np.clip(x, -module.limit, module.limit)
+        y = (x * module.gain) >> 8
+        level = np.abs(y)
+
+        # Soft knee: interpolated tanh table above the threshold.
+        threshold = module.threshold
+        shift = module.curve_shift
+        curve = table(module.curve).astype(np.int64)
+        excess = np.maximum(level - threshold, 0)
+        j = np.minimum(excess >> shift, 255)
+        a = curve[j]
+        b = curve[np.minimum(j + 1, 255)]
+        limited = threshold + a + (((b - a) * (excess & ((1 << shift) - 1))) >> shift)
+        limited = np.where(j >= 255, threshold + curve[255], limited)
+        out = np.where(level > threshold, np.minimum(limited, 32767), level)
+
+        size = module.base.buffer_size
+        module.peak_in = int(level[-size:].max())
+        module.peak_out = int(out[-size:].max())
+        return store(np.where(y >= 0, out, -out))
+
+    def envelope(self, module, inputs, n):
+        buffer_size = module.base.buffer_size
+        levels = np.zeros(n, dtype=np.int64)
+        for start in range(0, n, buffer_size):
+            if module.pending:
+                module._apply_trigger()
+            if module.stage != synth.Envelope.IDLE:
+                levels[start : start + buffer_size] = self._envelope_block(module, buffer_size)
+            else:
+                module.active = False
+
+        source = unsigned(inputs.get("input", np.zeros(n, dtype=np.int16)))
+        values = levels >> 15
+        negative = source > 32768
+        out = np.where(
+            negative,
+            65536 - (((65536 - source) * values) >> 8),
+            (source * values) >> 8,
+        )
+        return store(out)
+
+    def _envelope_block(self, module, count):
+        # Levels of one block, segment by segment like Envelope.update():
+        # linear segments in closed form, exponential ones sample by sample.
+        out = np.empty(count, dtype=np.int64)
+        level, stage = module.level, module.stage
+        step, coef, target, end = module.step, module.coef, module.target, module.end
+        i = 0
+        while i < count:
+            if stage == synth.Envelope.IDLE or stage == synth.Envelope.SUSTAIN:
+                out[i:] = level
+                break
+
+            crossed = False
+            if coef == 0:
+                k = max(-((level - end) // step), 1) if step else 1
+                m = min(k, count - i)
+                out[i : i + m] = level + step * np.arange(1, m + 1)
+                level += step * m
+                i += m
+                crossed = m == k
+            else:
+                while i < count:
+                    level += step + ((((target - level) >> 8) * coef) >> 8)
+                    crossed = level >= end if stage == synth.Envelope.ATTACK else level <= end
+                    if crossed:
+                        break
+                    out[i] = level
+                    i += 1
+                i += crossed
+
+            if crossed:
+                level = end
+                out[i - 1] = end
+                if stage == synth.Envelope.ATTACK:
+                    stage = synth.Envelope.DECAY
+                    step, coef = module.decay_step, module.decay_coef
+                    target, end = module.decay_target, module.sustain_level
+                elif stage == synth.Envelope.DECAY:
+                    stage = synth.Envelope.SUSTAIN
+                else:
+                    stage = synth.Envelope.IDLE
+
+        module.level, module.stage = level, stage
+        module.step, module.coef, module.target, module.end = step, coef, target, end
+        module.active = stage != synth.Envelope.IDLE
+        return out
+
+    def _filter_state(self, module):
+        key = str(module.get_id())
+        if key not in self.state:
+            self.state[key] = [0.0, 0.0]
+        return self.state[key]
+
+    def low_pass(self, module, inputs, n):
+        x = inputs.get("input", np.zeros(n, dtype=np.int16)).astype(np.float64)
+        a = module.alpha / 256
+        state = self._filter_state(module)
+        dx = np.diff(x, prepend=state[0])
+        y = one_pole(a * dx, a, state[1])
+        state[0] = x[-1]
+        state[1] = y[-1]
+        return store(np.floor(y))
+
+    def high_pass(self, module, inputs, n):
+        x = inputs.get("input", np.zeros(n, dtype=np.int16)).astype(np.float64)
+        a = module.alpha / 256
+        state = self._filter_state(module)
+        dx = np.diff(x, prepend=state[0])
+        y = one_pole(a * dx, a * a, state[1])
+        state[0] = x[-1]
+        state[1] = y[-1]
+        return store(np.floor(y))
+
+    def reverb(self, module, inputs, n):
+        x = inputs.get("input", np.zeros(n, dtype=np.int16)).astype(np.float64)
+        key = str(module.get_id())
+        if key not in self.state:
+            self.state[key] = {
+                "combs": [np.zeros(s) for s in module.comb_sizes],
+                "filters": [0.0] * len(module.comb_sizes),
+                "allpasses": [np.zeros(s) for s in module.allpass_sizes],
+                "position": 0,
+            }
+        state = self.state[key]
+        roomsize = module.roomsize_fp / 32768
+        damp1 = module.damp1_fp / 32768
+        damp2 = module.damp2_fp / 32768
+        position = state["position"]
+
+        comb_sum = np.zeros(n)
+        for j, line in enumerate(state["combs"]):
+            size = len(line)
+            f0 = state["filters"][j]
+            for start in range(0, n, size):
+                # Each chunk only reads samples written at least one line
+                # length earlier, so it can be done in one vector step.
+                m = min(size, n - start)
+                idx = (position + start + np.arange(m)) % size
+                y = line[idx]
+                comb_sum[start : start + m] += y
+                f = one_pole(damp2 * y, damp1, f0)
+                line[idx] = np.floor(x[start : start + m] / 8) + f * roomsize
+                f0 = f[-1]
+            state["filters"][j] = f0
+
+        out = comb_sum / 4
+        for line in state["allpasses"]:
+            size = len(line)
+            result = np.empty(n)
+            for start in range(0, n, size):
+                m = min(size, n - start)
+                idx = (position + start + np.arange(m)) % size
+                y = line[idx]
+                line[idx] = out[start : start + m] + y / 2
+                result[start : start + m] = y - out[start : start + m]
+            out = result
+
+        state["position"] = position + n
+        mixed = x * (module.mix_dry / 32768) + out * (module.mix_wet / 32768)
+        return store(np.floor(mixed))
+
+    def device(self, module, inputs, n):
+        """Run the module's own update() one block at a time."""
+        buffer_size = module.base.buffer_size
+        saved = module.buffer
+        sources = {name: m for name, m in module.inputs.items()}
+        saved_sources = {name: m.buffer for name, m in sources.items()}
+        out = np.empty(n, dtype=np.int16)
+        try:
+            module.buffer = array.array("h", bytes(buffer_size * 2))
+            silence = array.array("h", bytes(buffer_size * 2))
+            for start in range(0, n, buffer_size):
+                for name, m in sources.items():
+                    block = inputs[name][start : start + buffer_size]
+                    m.buffer = array.array("h", block.tobytes())
+                module.bind(silence)
+                module.update()
+                out[start : start + buffer_size] = table(module.buffer)
+        finally:
+            module.buffer = saved
+            for name, m in sources.items():
+                m.buffer = saved_sources[name]
+            self.synth.invalidate()
+        return out
+
+
+def compare(synth_instance, blocks, exact=False):
+    """Render ``blocks`` blocks with the device kernels and with NumpyEngine.
+
+    Both run on copies of the patch. Returns {module ID: (class name,
+    mismatching samples, max abs difference)}.
+    """
+    synth_instance.invalidate()
+    device = copy.deepcopy(synth_instance, shared_tables())
+    offline = copy.deepcopy(synth_instance, shared_tables())
+
+    order = device.sort_modules(device.output)
+    device.compile()
+    expected = {str(m.get_id()): [] for m in order}
+    for _ in range(blocks):
+        for module in order:
+            if not isinstance(module, synth.Input):
+                module.update()
+            if module.buffer is None:
+                block = store(np.full(module.base.buffer_size, module.value))
+            else:
+                block = table(module.buffer).copy()
+            expected[str(module.get_id())].append(block)
+
+    engine = NumpyEngine(offline, exact=exact)
+    rendered = engine.render(blocks * synth_instance.base.buffer_size, modules=True)
+
+    report = {}
+    for module in order:
+        key = str(module.get_id())
+        want = np.concatenate(expected[key]).astype(np.int64)
+        got = rendered[key].astype(np.int64)
+        diff = np.abs(want - got)
+        report[key] = (type(module).__name__, int(np.count_nonzero(diff)), int(diff.max()))
+    return report
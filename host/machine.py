@@ -0,0 +1,294 @@
+import threading
+from host.clock import CLOCK
+
+# Stand-in for the rp2 ``machine`` module. Pins share one level table so a
+# scripted timeline can drive inputs; SPI and I2S forward what the firmware
+# writes to the sinks registered for their bus id.
+
+
+def freq(hz=None):
+    return 125_000_000
+
+
+def unique_id():
+    return b"\x00host\x00\x00\x00"
+
+
+def reset():
+    raise SystemExit("machine.reset()")
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    ALT = 3
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    levels = {}
+    irqs = {}
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        if isinstance(id, Pin):
+            id = id.id
+        self.id = id
+        self.init(mode, pull, value)
+
+    def init(self, mode=-1, pull=-1, value=None):
+        if self.id not in Pin.levels:
+            Pin.levels[self.id] = 1 if pull == Pin.PULL_UP else 0
+        if value is not None:
+            self.value(value)
+
+    def value(self, value=None):
+        if value is None:
+            return Pin.levels.get(self.id, 0)
+        Pin.levels[self.id] = 1 if value else 0
+
+    def __call__(self, value=None):
+        return self.value(value)
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    high = on
+    low = off
+
+    def toggle(self):
+        self.value(1 - self.value())
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        if handler is None:
+            Pin.irqs.pop(self.id, None)
+        else:
+            Pin.irqs[self.id] = (handler, trigger, self)
+
+    @classmethod
+    def level(cls, id):
+        return cls.levels.get(id, 0)
+
+    @classmethod
+    def drive(cls, id, level):
+        """Change a pin from outside the firmware and fire its IRQ handler."""
+        level = 1 if level else 0
+        old = cls.levels.get(id, 0)
+        cls.levels[id] = level
+        if old == level:
+            return
+
+        entry = cls.irqs.get(id, None)
+        if entry is not None:
+            handler, trigger, pin = entry
+            edge = Pin.IRQ_RISING if level else Pin.IRQ_FALLING
+            if trigger & edge:
+                handler(pin)
+
+
+class PWM:
+    def __init__(self, pin, freq=1000, duty_u16=0):
+        self.pin = pin
+        self._freq = freq
+        self._duty = duty_u16
+
+    def freq(self, value=None):
+        if value is None:
+            return self._freq
+        self._freq = value
+
+    def duty_u16(self, value=None):
+        if value is None:
+            return self._duty
+        self._duty = value
+
+    def deinit(self):
+        pass
+
+
+class ADC:
+    def __init__(self, pin):
+        self.pin = pin
+
+    def read_u16(self):
+        return 0
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, **kwargs):
+        self._timer = None
+        if kwargs:
+            self.init(**kwargs)
+
+    def init(self, mode=PERIODIC, period=-1, freq=-1, callback=None):
+        self.deinit()
+        if freq > 0:
+            period = 1000 / freq
+        self.mode = mode
+        self.period = period
+        self.callback = callback
+        self._schedule()
+
+    def _schedule(self):
+        self._timer = threading.Timer(CLOCK.real(self.period / 1000), self._fire)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _fire(self):
+        if self.mode == Timer.PERIODIC:
+            self._schedule()
+        if self.callback is not None:
+            self.callback(self)
+
+    def deinit(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+
+class SPI:
+    MSB = 0
+    LSB = 1
+
+    captures = {}
+
+    def __init__(self, id, baudrate=1_000_000, polarity=0, phase=0, bits=8,
+                 firstbit=MSB, sck=None, mosi=None, miso=None):
+        self.id = id
+        self.capture = SPI.captures.get(id, None)
+
+    def init(self, *args, **kwargs):
+        pass
+
+    def write(self, buf):
+        if self.capture is not None:
+            self.capture.write(bytes(buf))
+
+    def read(self, nbytes, write=0x00):
+        return bytes([write]) * nbytes
+
+    def readinto(self, buf, write=0x00):
+        for i in range(len(buf)):
+            buf[i] = write
+
+    def write_readinto(self, write_buf, read_buf):
+        self.write(write_buf)
+        self.readinto(read_buf)
+
+    def deinit(self):
+        pass
+
+
+class I2S:
+    TX = 0
+    RX = 1
+    MONO = 0
+    STEREO = 1
+
+    sinks = {}
+
+    def __init__(self, id, sck=None, ws=None, sd=None, mode=TX, bits=16,
+                 format=MONO, rate=8000, ibuf=2000):
+        self.id = id
+        self.rate = self.bits = self.channels = None
+        self.underruns = 0
+        self.handler = None
+        self._dma = None
+        # Bumped by deinit(), so a transfer that was already in flight
+        # completes into nothing instead of into the re-initialised bus.
+        self.generation = 0
+        self.sink = I2S.sinks.get(id, None)
+        self.init(sck, ws, sd, mode, bits, format, rate, ibuf)
+
+    def init(self, sck=None, ws=None, sd=None, mode=TX, bits=16, format=MONO,
+             rate=8000, ibuf=2000):
+        # A WAV sink can only hold one format, so it restarts when a
+        # re-init changes the rate or sample width.
+        channels = 2 if format == I2S.STEREO else 1
+        changed = (self.rate, self.bits, self.channels) != (rate, bits, channels)
+        if self.sink is not None and changed:
+            self.sink.open(rate, bits, channels)
+        self.rate = rate
+        self.bits = bits
+        self.channels = channels
+        self.frame_bytes = bits // 8 * self.channels
+        self.ibuf = ibuf
+        self.start = None
+        self.queued = 0
+
+    def _played(self):
+        frames = int((CLOCK.now() - self.start) * self.rate)
+        return frames * self.frame_bytes
+
+    def pending(self):
+        """Bytes queued for the DMA that have not been clocked out yet."""
+        if self.start is None:
+            return 0
+        return max(0, self.queued - self._played())
+
+    def delay(self, nbytes):
+        """Seconds of device time until ``nbytes`` fit into the internal buffer."""
+        excess = self.pending() + nbytes - self.ibuf
+        return max(0, excess) / (self.rate * self.frame_bytes)
+
+    def _queue(self, data):
+        if self.start is None:
+            self.start = CLOCK.now()
+        else:
+            gap = self._played() - self.queued
+            if gap > 0:
+                # The DMA ran dry: the device would have played silence.
+                self.underruns += 1
+                if self.sink is not None:
+                    self.sink.write(bytes(gap - gap % self.frame_bytes))
+                self.start = CLOCK.now()
+                self.queued = 0
+
+        self.queued += len(data)
+        if self.sink is not None:
+            self.sink.write(data)
+
+    def write(self, buf):
+        if self.handler is not None:
+            return self._write_nonblocking(buf)
+        data = bytes(buf)
+        CLOCK.sleep(self.delay(len(data)))
+        self._queue(data)
+        return len(data)
+
+    def _write_nonblocking(self, buf):
+        # With an irq handler write() returns at once. The buffer is copied
+        # when it fits into ibuf, then the handler runs like the DMA
+        # completion interrupt on the device.
+        self._dma = threading.Timer(
+            CLOCK.real(self.delay(len(buf))), self._complete,
+            (buf, self.generation),
+        )
+        self._dma.daemon = True
+        self._dma.start()
+        return len(buf)
+
+    def _complete(self, buf, generation):
+        if generation != self.generation:
+            return
+        self._queue(bytes(buf))
+        handler = self.handler
+        if handler is not None and generation == self.generation:
+            handler(self)
+
+    def irq(self, handler):
+        self.handler = handler
+
+    def deinit(self):
+        self.generation += 1
+        self.handler = None
+        if self._dma is not None:
+            self._dma.cancel()
+            self._dma = None
@@ -0,0 +1,81 @@
+# Stand-in for the MicroPython ``micropython`` module. Code emitters become
+# plain Python; the viper pointer types reproduce the device semantics the
+# kernels rely on: 8 and 16-bit reads are unsigned, 32-bit reads are
+# signed viper ints, and stores are truncated to the item width.
+
+
+def const(value):
+    return value
+
+
+def viper(func):
+    return func
+
+
+def native(func):
+    return func
+
+
+def asm_thumb(func):
+    def unsupported(*args):
+        raise NotImplementedError(f"{func.__name__} is an asm_thumb routine")
+
+    return unsupported
+
+
+def schedule(func, arg):
+    func(arg)
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def opt_level(level=None):
+    return 0
+
+
+def mem_info(verbose=False):
+    print("mem: host simulator")
+
+
+class Pointer:
+    __slots__ = ("view", "mask", "sign")
+
+    def __init__(self, obj, fmt):
+        if isinstance(obj, Pointer):
+            obj = obj.view
+        view = memoryview(obj)
+        if view.format != "B":
+            view = view.cast("B")
+        self.view = view.cast(fmt)
+        bits = 8 * self.view.itemsize
+        self.mask = (1 << bits) - 1
+        # Signed formats read back as viper ints, e.g. ptr32 words.
+        self.sign = 1 << (bits - 1) if fmt.islower() else 0
+
+    def __getitem__(self, index):
+        return self.view[index]
+
+    def __setitem__(self, index, value):
+        value &= self.mask
+        if self.sign and value >= self.sign:
+            value -= self.mask + 1
+        self.view[index] = value
+
+
+def ptr8(obj):
+    return Pointer(obj, "B")
+
+
+def ptr16(obj):
+    return Pointer(obj, "H")
+
+
+def ptr32(obj):
+    # A 32-bit load fills a whole viper int, so words read back signed.
+    return Pointer(obj, "i")
+
+
+def uint(value):
+    return int(value) & 0xFFFFFFFF
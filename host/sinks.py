@@ -0,0 +1,138 @@
+import os
+import wave
+from host.clock import CLOCK
+from host.machine import Pin
+
+CASET = 0x2A
+RASET = 0x2B
+RAMWR = 0x2C
+MADCTL = 0x36
+
+
+class WavSink:
+    """Collects everything written to an I2S bus into a WAV file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.wav = None
+        self.bytes = 0
+
+    def open(self, rate, bits, channels):
+        self.close()
+        self.wav = wave.open(self.path, "wb")
+        self.wav.setnchannels(channels)
+        self.wav.setsampwidth(bits // 8)
+        self.wav.setframerate(rate)
+
+    def write(self, data):
+        if self.wav is not None:
+            self.wav.writeframes(data)
+            self.bytes += len(data)
+
+    def close(self):
+        if self.wav is not None:
+            self.wav.close()
+            self.wav = None
+
+
+class FrameCapture:
+    """Decodes the ST7735 command stream into RGB565 frames saved as PPM."""
+
+    def __init__(self, directory, dc=4, interval=0.5, size=162):
+        self.directory = directory
+        self.dc = dc
+        self.interval = interval
+        self.size = size
+        self.pixels = bytearray(size * size * 2)
+        self.command = None
+        self.args = bytearray()
+        self.window = (0, 0, 0, 0)
+        self.x = 0
+        self.y = 0
+        self.pending = None
+        self.extent = (0, 0)
+        self.dirty = False
+        self.last_save = CLOCK.now()
+        self.frames = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, data):
+        if Pin.level(self.dc) == 0:
+            for command in data:
+                self._command(command)
+        else:
+            self._data(data)
+
+        if self.dirty and CLOCK.now() - self.last_save >= self.interval:
+            self.save()
+
+    def _command(self, command):
+        self.command = command
+        self.args = bytearray()
+        self.pending = None
+        if command == RAMWR:
+            self.x = self.window[0]
+            self.y = self.window[1]
+
+    def _data(self, data):
+        if self.command == RAMWR:
+            if self.pending is not None:
+                data = bytes([self.pending]) + data
+                self.pending = None
+            if len(data) % 2:
+                self.pending = data[-1]
+                data = data[:-1]
+            for i in range(0, len(data), 2):
+                self._pixel(data[i], data[i + 1])
+            return
+
+        self.args += data
+        if self.command in (CASET, RASET) and len(self.args) >= 4:
+            # The panel is smaller than 256 pixels, so only the low address
+            # bytes matter (the driver sends its offset in the high byte).
+            start = self.args[1]
+            end = self.args[3]
+            x0, y0, x1, y1 = self.window
+            if self.command == CASET:
+                self.window = (start, y0, end, y1)
+            else:
+                self.window = (x0, start, x1, end)
+
+    def _pixel(self, high, low):
+        x0, y0, x1, y1 = self.window
+        if self.x < self.size and self.y < self.size:
+            offset = (self.y * self.size + self.x) * 2
+            self.pixels[offset] = high
+            self.pixels[offset + 1] = low
+            self.extent = (max(self.extent[0], self.x + 1), max(self.extent[1], self.y + 1))
+            self.dirty = True
+        self.x += 1
+        if self.x > x1:
+            self.x = x0
+            self.y += 1
+            if self.y > y1:
+                self.y = y0
+
+    def save(self):
+        width, height = self.extent
+        if width == 0 or height == 0:
+            return None
+
+        path = os.path.join(self.directory, f"frame_{self.frames:05d}.ppm")
+        rgb = bytearray(width * height * 3)
+        for y in range(height):
+            for x in range(width):
+                offset = (y * self.size + x) * 2
+                color = (self.pixels[offset] << 8) | self.pixels[offset + 1]
+                i = (y * width + x) * 3
+                rgb[i] = (color >> 8) & 0xF8
+                rgb[i + 1] = (color >> 3) & 0xFC
+                rgb[i + 2] = (color << 3) & 0xF8
+        with open(path, "wb") as f:
+            f.write(f"P6 {width} {height} 255\n".encode())
+            f.write(rgb)
+
+        self.frames += 1
+        self.dirty = False
+        self.last_save = CLOCK.now()
+        return path
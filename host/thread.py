@@ -0,0 +1,24 @@
+import _thread
+import threading
+
+# MicroPython's _thread with daemon threads, so a simulated core never keeps
+# the host process alive. Everything else falls through to CPython's _thread.
+
+threads = []
+
+
+def start_new_thread(function, args, kwargs=None):
+    thread = threading.Thread(
+        target=function, args=args, kwargs=kwargs or {}, daemon=True
+    )
+    thread.start()
+    threads.append(thread)
+    return thread.ident
+
+
+def stack_size(size=None):
+    return 0
+
+
+def __getattr__(name):
+    return getattr(_thread, name)
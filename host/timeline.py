@@ -0,0 +1,52 @@
+import json
+import threading
+from host.clock import CLOCK
+from host.machine import Pin
+
+# A scripted input timeline is a JSON list of events in device seconds:
+#
+#   [{"t": 0.5, "press": 13}, {"t": 0.9, "release": 13},
+#    {"t": 1.2, "turn": 3}, {"t": 1.5, "set": 22, "level": 1}]
+#
+# Buttons are wired with pull-ups, so "press" pulls the pin low. "turn" steps
+# the rotary encoder by quadrature edges on its A/B pins.
+
+
+class Timeline:
+    def __init__(self, events, encoder=(26, 27)):
+        self.events = sorted(events, key=lambda event: event["t"])
+        self.encoder = encoder
+        self.thread = None
+
+    @classmethod
+    def load(cls, path, encoder=(26, 27)):
+        with open(path) as f:
+            return cls(json.load(f), encoder)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        for event in self.events:
+            CLOCK.sleep(event["t"] - CLOCK.now())
+            self.apply(event)
+
+    def apply(self, event):
+        if "press" in event:
+            Pin.drive(event["press"], 0)
+        elif "release" in event:
+            Pin.drive(event["release"], 1)
+        elif "turn" in event:
+            self.turn(event["turn"])
+        elif "set" in event:
+            Pin.drive(event["set"], event.get("level", 1))
+        else:
+            raise ValueError(f"Unknown timeline event: {event}")
+
+    def turn(self, steps):
+        pin_a, pin_b = self.encoder
+        for _ in range(abs(steps)):
+            level = Pin.level(pin_a)
+            Pin.drive(pin_b, level if steps > 0 else 1 - level)
+            Pin.drive(pin_a, 1 - level)
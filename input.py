@@ -70,21 +70,92 @@ class RotaryEncoder:
 
 class Speaker:
     def __init__(self, sample_rate=8000, bits=16, buffer_size=2000):
-        bck_pin = Pin(16)
-        lrc_pin = Pin(17)
-        din_pin = Pin(18)
+        self.pins = {"sck": Pin(16), "ws": Pin(17), "sd": Pin(18)}
+        self.bits = bits
+        self.ring = None
+        # Set once the bus is driven from core 0 while the synth may render
+        # elsewhere (AudioEngine.feed(), start_irq()): a new config then
+        # waits for apply_config() on core 0 between two blocks.
+        self.deferred = False
+        self.pending = None
 
         self.audio = I2S(
             0,
-            sck=bck_pin,
-            ws=lrc_pin,
-            sd=din_pin,
             mode=I2S.TX,
             bits=bits,
             format=I2S.MONO,
             rate=sample_rate,
             ibuf=buffer_size,
+            **self.pins,
         )
 
+    @classmethod
+    def from_config(cls, base):
+        """A speaker for the 16-bit blocks of a synth running on base."""
+        return cls(base.sample_rate, 16, base.i2s_buffer)
+
+    def configure(self, base):
+        """Synth listener: restart the bus with the synth's new settings."""
+        self.pending = base
+        if not self.deferred:
+            self.apply_config()
+
+    def apply_config(self):
+        """Re-init the bus for a pending config; only the bus owner calls this."""
+        base = self.pending
+        if base is None:
+            return False
+        self.pending = None
+        self.audio.deinit()
+        self.audio.init(
+            mode=I2S.TX,
+            bits=self.bits,
+            format=I2S.MONO,
+            rate=base.sample_rate,
+            ibuf=base.i2s_buffer,
+            **self.pins,
+        )
+        if self.ring is not None:
+            # deinit() dropped the handler and the block in flight.
+            self.silence = bytearray(base.buffer_size * self.bits // 8)
+            self.audio.irq(self._irq)
+            self._irq(self.audio)
+        return True
+
     def write(self, buffer):
         self.audio.write(buffer)
+
+    def start_irq(self, ring):
+        """Play an audio.AudioRing from the I2S interrupt instead of a task."""
+        self.ring = ring
+        self.silence = bytearray(ring.block_size * self.bits // 8)
+        self.playing = False
+        self.ready = asyncio.ThreadSafeFlag()
+        self.deferred = True
+        self.audio.irq(self._irq)
+        self._irq(self.audio)
+
+    async def follow(self):
+        """Core 0 task for start_irq() when another core renders: re-init
+        the bus for a new config once the irq has handed over a block."""
+        while True:
+            await self.ready.wait()
+            self.apply_config()
+
+    def _irq(self, audio):
+        # The DMA has taken the previous block: free its slot, hand over the
+        # next one and wake the renderer. Nothing is allocated here.
+        ring = self.ring
+        if self.playing:
+            ring.release()
+        block = ring.read_slot()
+        self.playing = block is not None
+        if block is None:
+            if ring.blocks:
+                ring.underruns += 1
+            block = self.silence
+        audio.write(block)
+        self.ready.set()
+
+    def get_underruns(self):
+        return self.ring.underruns
@@ -1,6 +1,9 @@
 import time
 
-time.sleep(1)
+# Window to break into the REPL before the firmware takes over the board.
+BOOT_DELAY_MS = 0
+
+time.sleep_ms(BOOT_DELAY_MS)
 
 import input
 import asyncio
@@ -8,19 +11,32 @@ import synth
 import notes
 import time
 import display
+import audio
 import _thread
 
+# "asyncio": render in an asyncio task next to the UI, display on core 1
+# "core": render on core 1 into a ring buffer, I2S feeding and UI on core 0
+AUDIO_MODE = "asyncio"
+# "stream": blocks go out through asyncio.StreamWriter
+# "irq": the I2S interrupt takes blocks from a ring of AUDIO_RING_DEPTH buffers
+AUDIO_OUTPUT = "stream"
+AUDIO_RING_DEPTH = 3
+POLYPHONY = 4
+
 BUTTONS = input.Buttons(([13, 12, 11, 10, 9, 8, 7, 6]))
 ROTARY_ENCODER = input.RotaryEncoder(26, 27, 28)
 LEDS = input.Led([19, 20, 21, 22])
-SPEAKER = input.Speaker(buffer_size=600)
+# The speaker follows the synth's Config, also through SYNTH.reconfigure().
 SYNTH = synth.Synth(synth.Config())
+SPEAKER = input.Speaker.from_config(SYNTH.base)
+SYNTH.add_listener(SPEAKER.configure)
 MENUE = display.Window(SYNTH)
 
 frequency_module = SYNTH.add_module(synth.Input)
 frequency_module2 = SYNTH.add_module(synth.Input)
 frequency_module3 = SYNTH.add_module(synth.Input)
 volume_sine = SYNTH.add_module(synth.Sine)
+voices = SYNTH.add_module(synth.VoiceManager)
 base_sine = SYNTH.add_module(synth.Sine)
 sine = SYNTH.add_module(synth.Sine)
 # saw = SYNTH.add_module(synth.Sawtooth)
@@ -57,7 +73,9 @@ sine.set("frequency", frequency_module)
 # square.set("frequency", frequency_module)
 # triangle.set("frequency", frequency_module)
 
-mixer.set("input0", sine)
+voices.set_voices(POLYPHONY)
+# mixer.set("input0", sine)
+mixer.set("input0", voices)
 mixer.set("input1", base_sine)
 mixer.set("input1_volume", volume_sine)
 # mixer.set("2", mixer2)
@@ -74,7 +92,17 @@ hpf.set("input", envelope)
 SYNTH.output.set("input", lpf)
 
 
-_thread.start_new_thread(MENUE.display, ())
+# Table rebuilds from the settings menu run in slices in updateparameters()
+# and are swapped in between two audio blocks.
+PARAMETERS = SYNTH.enable_background_updates()
+
+ENGINE = None
+if AUDIO_MODE == "core" or AUDIO_OUTPUT == "irq":
+    ENGINE = audio.AudioEngine(SYNTH, depth=AUDIO_RING_DEPTH)
+if AUDIO_MODE == "core":
+    _thread.start_new_thread(ENGINE.render_loop, ())
+else:
+    _thread.start_new_thread(MENUE.display, ())
 
 
 async def updatespeaker():
@@ -91,6 +119,21 @@ async def updatespeaker():
         stream.write(next_buffer)
 
 
+async def updatedisplay(draw=True):
+    while True:
+        if MENUE.display_state == "Graph":
+            MENUE.set_buffer(SYNTH.read())
+        if draw:
+            MENUE.display_step()
+        await asyncio.sleep_ms(10)
+
+
+async def updateparameters():
+    while True:
+        PARAMETERS.step()
+        await asyncio.sleep_ms(5)
+
+
 def record_loop(pause_time, freq, time):
     global loop_buffer
     loop_buffer.append([pause_time, freq, time])
@@ -100,9 +143,10 @@ async def play_loop():
     while True:
         for pause_time, freq, time in loop_buffer:
             await asyncio.sleep_ms(pause_time)
-            frequency_module.set_value(freq)
+            voices.note_on(freq, "loop")
             envelope.trigger_attack()
             await asyncio.sleep_ms(time)
+            voices.note_off("loop")
             envelope.trigger_release()
         await asyncio.sleep(0.5)
 
@@ -129,7 +173,20 @@ async def main():
     global is_recording, is_playing, loop_buffer, last_press_time
     encoder = ROTARY_ENCODER
     buttons = BUTTONS
-    asyncio.create_task(updatespeaker())
+    if AUDIO_OUTPUT == "irq":
+        SPEAKER.start_irq(ENGINE.ring)
+    if AUDIO_MODE == "core":
+        if AUDIO_OUTPUT == "stream":
+            asyncio.create_task(ENGINE.feed(SPEAKER))
+        else:
+            asyncio.create_task(SPEAKER.follow())
+        asyncio.create_task(updatedisplay())
+    elif AUDIO_OUTPUT == "irq":
+        asyncio.create_task(ENGINE.render_task(SPEAKER))
+        asyncio.create_task(updatedisplay(draw=False))
+    else:
+        asyncio.create_task(updatespeaker())
+    asyncio.create_task(updateparameters())
     LEDS.set_led_off(0)
     LEDS.set_led_on(3)
     pressd = False
@@ -138,10 +195,21 @@ async def main():
     time_pause = 0
     record = False
     looping = None
+    held = [False] * 5
 
     SYNTH.output.set_amplitude(20)
 
     while True:
+        # Every note button gets its own voice; a note starts and stops with
+        # its button, independent of the others.
+        for i in range(5):
+            is_pressed = buttons.get_buttons()[i].is_pressed
+            if is_pressed and not held[i]:
+                voices.note_on(int(pentatonik_frequencies[i]), i)
+            elif not is_pressed and held[i]:
+                voices.note_off(i)
+            held[i] = is_pressed
+
         for i, button in enumerate(buttons.get_buttons()):
 
             if button.is_pressed and not pressd:
@@ -150,7 +218,6 @@ async def main():
                 pressd = True
 
                 if i <= 4 and i >= 0:
-                    frequency_module.set_value(int(pentatonik_frequencies[i]))
                     last_freq = int(pentatonik_frequencies[i])
                     envelope.trigger_attack()
                     LEDS.set_led_on(2)
@@ -173,8 +240,13 @@ async def main():
                         loop_buffer = []
                     else:
                         print("kein loop")
-                elif i == 6:  # Loop abspielen
-                    pass
+                elif i == 6:  # Profiler an/aus
+                    if MENUE.get_menu_state() == "Profiler":
+                        SYNTH.disable_profiling()
+                        MENUE.switch("Graph")
+                    else:
+                        SYNTH.enable_profiling()
+                        MENUE.switch("Profiler")
 
                 elif i == 7:
                     if MENUE.get_menu_state() == "New_Module_Menu":
@@ -0,0 +1,6 @@
+# Firmware manifest that freezes the pre-generated tables into flash:
+#
+#   python tools/build_luts.py
+#   make -C ports/rp2 BOARD=RPI_PICO FROZEN_MANIFEST=/path/to/synth/manifest.py
+include("$(PORT_DIR)/boards/manifest.py")
+module("luts.py")
@@ -3,12 +3,61 @@ import micropython
 import random
 import math
 import array
+import time
+
+try:
+    # Tables pre-generated by tools/build_luts.py, ideally frozen into flash.
+    from luts import TABLES as FROZEN_LUTS
+except ImportError:
+    FROZEN_LUTS = {}
 
 
 def get_fixed_float(v):
     return max(int(max(min(v, 1), 0) * 256), 0)
 
 
+@micropython.viper
+def fill(target, value: int, size: int):
+    buf = ptr16(target)
+    i = 0
+    while i < size:
+        buf[i] = value
+        i += 1
+
+
+def samples(table):
+    # Length of a table in 16-bit samples: array("h") tables count samples,
+    # frozen tables are memoryviews over bytes.
+    if isinstance(table, array.array):
+        return len(table)
+    return len(table) // 2
+
+
+@micropython.viper
+def accumulate(target, source, size: int):
+    buf = ptr16(target)
+    src = ptr16(source)
+    i = 0
+    while i < size:
+        buf[i] = buf[i] + src[i]
+        i += 1
+
+
+def run_slices(job):
+    # Drive a sliced job to the end and return its result.
+    try:
+        while True:
+            next(job)
+    except StopIteration as done:
+        return done.value
+
+
+def swap(apply):
+    # A job with nothing to build: apply() runs at the next block boundary.
+    yield
+    return apply
+
+
 class Uuid:
     def __init__(self, uuid=None):
         if isinstance(uuid, type(None)):
@@ -53,23 +102,353 @@ class Config:
         self.sample_rate = 8000
         self.buffer_size = 200
         self.max = 255
+        # Oscillator tables: entries (a power of two) and whether the kernel
+        # blends neighbouring entries on the fractional phase.
+        self.lut_size = 256
+        self.interpolate = True
+        # Upper bound for the Reverb's delay lines in bytes.
+        self.reverb_memory = 16384
+        # I2S driver's internal buffer in bytes. Blocks are always 16-bit.
+        self.i2s_buffer = 600
+
+
+# Config fields Synth.reconfigure() can change while the synth is running.
+RUNTIME_SETTINGS = ("sample_rate", "buffer_size", "i2s_buffer")
+
+
+def sine_table(amplitude, size):
+    lut = array.array("h", [0] * size)
+    for i in range(size):
+        lut[i] = int(amplitude * math.sin(2 * math.pi * i / size))
+    return lut
+
+
+# Harmonics in the richest mipmap level; every level after it has half.
+MIPMAP_HARMONICS = const(64)
+
+
+def harmonic_tables(amplitude, size, partial, offset=0.0):
+    return run_slices(harmonic_slices(amplitude, size, partial, offset))
+
+
+def harmonic_slices(amplitude, size, partial, offset=0.0):
+    # Octave mipmap from additive synthesis: partial(h) gives the sine and
+    # cosine amplitude of harmonic h. Harmonics are added one at a time and
+    # a level is taken at every power of two, reading sin(h * x) from an
+    # integer sine table instead of calling math.sin per sample. All levels
+    # share one scale so switching between them keeps the loudness. Yields
+    # after every harmonic and every scaled level.
+    sine = sine_table(32767, size)
+    yield
+    mask = size - 1
+    quarter = size // 4
+    values = [offset * 32767] * size
+    levels = []
+    harmonics = 1
+    for h in range(1, MIPMAP_HARMONICS + 1):
+        a, b = partial(h)
+        if a or b:
+            j = 0
+            for i in range(size):
+                values[i] += a * sine[j] + b * sine[(j + quarter) & mask]
+                j = (j + h) & mask
+            yield
+        if h == harmonics:
+            levels.append(values[:])
+            harmonics *= 2
+
+    peak = max(max(max(level), -min(level)) for level in levels) or 1
+    scale = amplitude / peak
+    tables = []
+    for level in reversed(levels):
+        tables.append(array.array("h", [int(v * scale) for v in level]))
+        yield
+    return tuple(tables)
+
+
+class LutCache:
+    def __init__(self):
+        # key -> [table, references]
+        self.tables = {}
+
+    def acquire(self, key, builder):
+        entry = self.tables.get(key, None)
+        if entry is None:
+            frozen = FROZEN_LUTS.get(key, None)
+            if frozen is None:
+                table = builder()
+            else:
+                table = self._view(frozen)
+            entry = [table, 0]
+            self.tables[key] = entry
+        entry[1] += 1
+        return entry[0]
+
+    def release(self, key):
+        entry = self.tables.get(key, None)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del self.tables[key]
+
+    def _view(self, frozen):
+        if isinstance(frozen, tuple):
+            return tuple(memoryview(part) for part in frozen)
+        return memoryview(frozen)
+
+    def has(self, key):
+        return key in self.tables or key in FROZEN_LUTS
+
+    def get(self, key):
+        # The table for key if it is cached or frozen, without a reference.
+        entry = self.tables.get(key, None)
+        if entry is not None:
+            return entry[0]
+        frozen = FROZEN_LUTS.get(key, None)
+        return None if frozen is None else self._view(frozen)
+
+    def get_references(self, key):
+        entry = self.tables.get(key, None)
+        return 0 if entry is None else entry[1]
+
+    def get_size(self):
+        size = 0
+        for table, _ in self.tables.values():
+            if isinstance(table, tuple):
+                size += sum(samples(part) * 2 for part in table)
+            else:
+                size += samples(table) * 2
+        return size
+
+
+# Read-only tables shared by every module in the process, keyed by
+# (shape, amplitude, size, variant).
+LUTS = LutCache()
+
+
+class BufferPool:
+    def __init__(self, base):
+        self.base = base
+        self.buffers = []
+
+    def allocate(self, order):
+        # Linear scan over the render order: a module's output is live from
+        # the step that writes it until the last step that reads it, and
+        # modules whose live ranges do not overlap share one physical buffer.
+        position = {}
+        for i, module in enumerate(order):
+            position[str(module.get_id())] = i
+
+        last_use = list(range(len(order)))
+        for i, module in enumerate(order):
+            for m in module.get_inputs().values():
+                j = position[str(m.get_id())]
+                if j >= i:
+                    # Read before it is written (feedback loop): the previous
+                    # block has to survive, so never share this buffer.
+                    last_use[j] = len(order)
+                else:
+                    last_use[j] = max(last_use[j], i)
+        # What feeds the last module is what Synth.read() hands out, so it
+        # must not be reused by the early steps of the next block either.
+        if order:
+            for m in order[-1].get_inputs().values():
+                last_use[position[str(m.get_id())]] = len(order)
+
+        assignment = []
+        free = []
+        live = []
+        count = 0
+        for i, module in enumerate(order):
+            if module.persistent:
+                continue
+
+            still_live = []
+            for end, index in live:
+                if end < i:
+                    free.append(index)
+                else:
+                    still_live.append((end, index))
+            live = still_live
+
+            if free and last_use[i] < len(order):
+                index = free.pop()
+            else:
+                index = count
+                count += 1
+
+            if last_use[i] < len(order):
+                live.append((last_use[i], index))
+            assignment.append((module, index))
+
+        size = self.base.buffer_size
+        self.buffers = [b for b in self.buffers[:count] if len(b) == size]
+        while len(self.buffers) < count:
+            self.buffers.append(array.array("h", [0] * size))
+
+        for module, index in assignment:
+            module.buffer = self.buffers[index]
+
+    def get_size(self):
+        return len(self.buffers) * self.base.buffer_size * 2
+
+
+class Profiler:
+    def __init__(self, window=32):
+        self.window = window
+        self.modules = []
+        self.times = array.array("I")
+        self.block_times = array.array("I", [0] * window)
+        self.position = 0
+        self.count = 0
+
+    def attach(self, modules):
+        # Per-module times are one flat ring: module k's slot i is at
+        # k * window + i.
+        self.modules = modules
+        self.times = array.array("I", [0] * (len(modules) * self.window))
+        self.position = 0
+        self.count = 0
+
+    def advance(self):
+        self.position = (self.position + 1) % self.window
+        if self.count < self.window:
+            self.count += 1
+
+    def stats(self, times, offset, count):
+        low = high = total = times[offset]
+        for i in range(offset + 1, offset + count):
+            t = times[i]
+            total += t
+            if t < low:
+                low = t
+            if t > high:
+                high = t
+        return low, total // count, high
+
+    def snapshot(self, base):
+        count = self.count
+        deadline = base.buffer_size * 1000000 // base.sample_rate
+        modules = []
+        block = (0, 0, 0)
+        if count:
+            for k, module in enumerate(self.modules):
+                low, mean, high = self.stats(self.times, k * self.window, count)
+                modules.append((str(module.get_id()), type(module).__name__, low, mean, high))
+            block = self.stats(self.block_times, 0, count)
+
+        return {
+            "modules": modules,
+            "block": block,
+            "deadline": deadline,
+            "load": block[1] / deadline,
+        }
+
+
+class ParameterService:
+    # Runs table and coefficient rebuilds in short slices off the audio
+    # path. A job is a generator that yields between slices and returns a
+    # function that installs its result; Synth.get_buffer() applies those
+    # between two blocks, so a kernel never sees a half-built table.
+    def __init__(self, budget_us=2000):
+        self.budget_us = budget_us
+        # (module id, name) -> job; a newer job for the same key replaces
+        # the pending one.
+        self.jobs = {}
+        # (module id, apply) in completion order
+        self.ready = []
+
+    def submit(self, module, name, job):
+        self.jobs[(str(module.get_id()), name)] = job
+
+    def cancel(self, module):
+        module_id = str(module.get_id())
+        for key in list(self.jobs):
+            if key[0] == module_id:
+                self.jobs.pop(key, None)
+        self.ready = [entry for entry in self.ready if entry[0] != module_id]
+
+    def clear(self):
+        self.jobs = {}
+        self.ready = []
+
+    def is_idle(self):
+        return not self.jobs and not self.ready
+
+    def step(self, budget_us=None):
+        # Advance the pending jobs round robin until the budget is spent.
+        if budget_us is None:
+            budget_us = self.budget_us
+        start = time.ticks_us()
+        while self.jobs:
+            for key in list(self.jobs):
+                job = self.jobs.get(key, None)
+                if job is None:
+                    continue
+                try:
+                    next(job)
+                except StopIteration as done:
+                    if self.jobs.get(key, None) is job:
+                        del self.jobs[key]
+                        self.ready.append((key[0], done.value))
+                if time.ticks_diff(time.ticks_us(), start) >= budget_us:
+                    return
+
+    def commit(self):
+        # Called by the renderer between blocks. pop() keeps this safe
+        # against step() appending from the other core.
+        ready = self.ready
+        while ready:
+            ready.pop(0)[1]()
+
+    def flush(self):
+        while self.jobs:
+            self.step()
+        self.commit()
 
 
 class Synth:
     def __init__(self, base):
         self.base = base
         self.modules = []
+        self.plan = None
+        self.scheduled = []
+        self.profiler = None
+        self.silence = None
+        self.pool = BufferPool(base)
+        self.parameters = None
+        # Config changes waiting for the next block, and the callbacks that
+        # follow them (the speaker, the audio ring).
+        self.pending = {}
+        self.listeners = []
         self.output = self.add_module(Output)
 
     def add_module(self, module):
         if isinstance(module, type(SynthModule)):
             new_module = module(self.base)
+            new_module.synth = self
             self.modules.append(new_module)
+            self.invalidate()
         else:
             raise TypeError("Module must be an instance of SynthModule")
 
         return new_module
 
+    def remove_module(self, module):
+        if module is self.output:
+            raise ValueError("The output module can not be removed")
+        self.modules.remove(module)
+        for other in self.modules:
+            for name, source in list(other.inputs.items()):
+                if source is module:
+                    other.remove(name)
+        if self.parameters is not None:
+            self.parameters.cancel(module)
+        module.close()
+        module.synth = None
+        self.invalidate()
+
     def get_module(self, uuid):
         if isinstance(uuid, Uuid):
             uuid = str(uuid)
@@ -82,24 +461,180 @@ class Synth:
 
         return module
 
+    def invalidate(self):
+        self.plan = None
+
+    def compile(self):
+        # Flatten the graph feeding the output into a list of bound update
+        # calls, ordered so every module runs after all of its inputs.
+        order = self.sort_modules(self.output)
+        self.pool.allocate(order)
+        if self.silence is None or len(self.silence) != self.base.buffer_size:
+            self.silence = array.array("h", [0] * self.base.buffer_size)
+
+        plan = []
+        scheduled = []
+        for module in order:
+            module.bind(self.silence)
+            if not isinstance(module, Input):
+                plan.append(module.update)
+                scheduled.append(module)
+
+        self.plan = plan
+        self.scheduled = scheduled
+        if self.profiler is not None:
+            self.profiler.attach(scheduled)
+        return order
+
+    def enable_profiling(self, window=32):
+        self.profiler = Profiler(window)
+        self.profiler.attach(self.scheduled)
+
+    def disable_profiling(self):
+        self.profiler = None
+
+    def enable_background_updates(self, budget_us=2000):
+        # Setters hand their rebuilds to a ParameterService from now on;
+        # whoever owns the UI loop has to call its step() regularly.
+        if self.parameters is None:
+            self.parameters = ParameterService(budget_us)
+        return self.parameters
+
+    def disable_background_updates(self):
+        if self.parameters is not None:
+            self.parameters.flush()
+            self.parameters = None
+
+    def add_listener(self, listener):
+        # listener(base) runs after a reconfigure has been applied, on the
+        # thread that renders.
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def reconfigure(self, **changes):
+        # Queue new audio settings; they take effect between two blocks,
+        # see apply_config().
+        for name, value in changes.items():
+            if name not in RUNTIME_SETTINGS:
+                raise ValueError(f"{name} can not be changed at runtime")
+            if not isinstance(value, int) or value <= 0:
+                raise ValueError(f"{name} must be a positive integer")
+        pending = dict(self.pending)
+        pending.update(changes)
+        self.pending = pending
+
+    def apply_config(self):
+        # The safe point: called before a block is rendered. Every module
+        # re-derives its tables, coefficients and delay lines right away, so
+        # the next block already runs at the new settings.
+        if not self.pending:
+            return False
+        changes = self.pending
+        self.pending = {}
+        for name, value in changes.items():
+            setattr(self.base, name, value)
+
+        parameters = self.parameters
+        self.parameters = None
+        if parameters is not None:
+            # Superseded: configure() rebuilds from the current settings.
+            parameters.clear()
+        try:
+            for module in self.modules:
+                module.configure()
+        finally:
+            self.parameters = parameters
+        self.invalidate()
+        for listener in self.listeners:
+            listener(self.base)
+        return True
+
+    def get_profile(self):
+        if self.profiler is None:
+            return None
+        return self.profiler.snapshot(self.base)
+
     def read(self):
-        return self.modules[0].inputs["input"].read()
+        if self.plan is None:
+            self.compile()
+        return self.output.input_buffer
 
     def get_buffer(self):
-        output = self.modules[0].read()
-        self.modules[0].reset()
-        return output
+        if self.pending:
+            self.apply_config()
+        return self.render()
+
+    def render(self):
+        if self.parameters is not None:
+            self.parameters.commit()
+        if self.plan is None:
+            self.compile()
+        if self.profiler is not None:
+            self.render_profiled()
+        else:
+            for update in self.plan:
+                update()
+        return self.output.buffer
+
+    def render_into(self, buffer):
+        # Point the output at the caller's buffer for one block so the result
+        # lands there without a copy. A pending config is left for the
+        # caller's next apply_config(): buffer has the current block size.
+        output = self.output
+        own = output.buffer
+        output.buffer = buffer
+        self.render()
+        output.buffer = own
+        return buffer
+
+    def render_profiled(self):
+        profiler = self.profiler
+        times = profiler.times
+        window = profiler.window
+        slot = profiler.position
+        start = time.ticks_us()
+        t0 = start
+        for update in self.plan:
+            update()
+            t1 = time.ticks_us()
+            times[slot] = time.ticks_diff(t1, t0)
+            t0 = t1
+            slot += window
+        profiler.block_times[profiler.position] = time.ticks_diff(t0, start)
+        profiler.advance()
 
     def get_modules(self):
         return self.modules
 
-    def sort_modules(self):
-        modules = self.modules[:]
-        visited = {str(m.get_id()): False for m in modules}
+    def memory_usage(self):
+        if self.plan is None:
+            self.compile()
+
+        buffer_bytes = self.base.buffer_size * 2
+        persistent = [
+            m for m in self.modules if m.persistent and m.buffer is not None
+        ]
+        pooled = self.pool.get_size()
+        used = pooled + (len(persistent) + 1) * buffer_bytes
+        return {
+            "modules": len(self.modules),
+            "buffers": len(self.pool.buffers) + len(persistent),
+            "bytes": used,
+            "unpooled_bytes": len(self.modules) * buffer_bytes,
+            "saved_bytes": len(self.modules) * buffer_bytes - used,
+            "lut_bytes": LUTS.get_size(),
+        }
+
+    def sort_modules(self, root=None):
+        modules = self.modules[:] if root is None else [root]
+        visited = {}
         stack = []
 
         for m in modules:
-            if not visited[str(m.get_id())]:
+            if not visited.get(str(m.get_id()), False):
                 self.sort_modules_util(m, visited, stack)
 
         return stack
@@ -107,18 +642,44 @@ class Synth:
     def sort_modules_util(self, module, visited, stack):
         visited[str(module.get_id())] = True
         for m in module.get_inputs().values():
-            if not visited[str(m.get_id())]:
+            if not visited.get(str(m.get_id()), False):
                 self.sort_modules_util(m, visited, stack)
         stack.append(module)
 
 
 class SynthModule:
+    # Modules whose buffer has to outlive a block keep their own; all others
+    # get one from the synth's BufferPool when the graph is compiled.
+    persistent = False
+    # A constant module holds one value per block in .value and only gets a
+    # buffer when a consumer asks for one. Consumers list the inputs they can
+    # read as a constant; those are bound to None and read <name>_source.value.
+    constant = False
+    constant_inputs = ()
+    lut = None
+    lut_key = None
+
     def __init__(self, base):
         self.base = base
         self.id = Uuid()
         self.inputs = {}
-        self.buffer = array.array("h", [0] * self.base.buffer_size)
-        self.is_updated = False
+        self.buffer = None
+        if self.persistent and not self.constant:
+            self.buffer = array.array("h", [0] * self.base.buffer_size)
+        self.synth = None
+
+    @classmethod
+    def memory_cost(cls, base):
+        # Heap bytes a new instance allocates beyond pooled buffers, so the
+        # UI can refuse a module that would not fit.
+        return base.buffer_size * 2 if cls.persistent else 0
+
+    def configure(self):
+        # Called by Synth.apply_config() after base.sample_rate or
+        # base.buffer_size changed; re-derive whatever depends on them.
+        if self.buffer is not None and self.persistent:
+            if len(self.buffer) != self.base.buffer_size:
+                self.buffer = array.array("h", [0] * self.base.buffer_size)
 
     def get_id(self):
         return self.id
@@ -130,25 +691,74 @@ class SynthModule:
         return []
 
     def read(self):
-        if not self.is_updated:
-            self.update()
-            self.is_updated = True
+        return self.buffer
 
+    def require_buffer(self):
         return self.buffer
 
-    def reset(self):
-        if self.is_updated:
-            self.is_updated = False
-            for module in self.inputs.values():
-                module.reset()
+    def bind(self, silence):
+        # Resolve input buffers once per compile so update() never has to
+        # look them up; unconnected inputs read silence.
+        for name in self.get_input_names():
+            module = self.inputs.get(name, None)
+            if module is None:
+                buffer = silence
+            elif module.constant and name in self.constant_inputs:
+                buffer = None
+            else:
+                buffer = module.require_buffer()
+            setattr(self, name + "_source", module)
+            setattr(self, name + "_buffer", buffer)
+
+    def invalidate(self):
+        if self.synth is not None:
+            self.synth.invalidate()
 
     def set(self, name, module):
         if not isinstance(module, SynthModule):
             raise TypeError("Input must be an instance of SynthModule")
         self.inputs[name] = module
+        self.invalidate()
 
     def remove(self, name):
         self.inputs.pop(name, None)
+        self.invalidate()
+
+    def use_lut(self, key, builder):
+        # Switch to the shared table for key and drop the reference to the
+        # previous one, so a table nobody uses any more is freed.
+        lut = LUTS.acquire(key, builder)
+        self.close()
+        self.lut_key = key
+        return lut
+
+    def schedule(self, name, job):
+        # Rebuilds run in slices on the synth's ParameterService when it has
+        # one, otherwise right away.
+        service = None if self.synth is None else self.synth.parameters
+        if service is None:
+            run_slices(job)()
+        else:
+            service.submit(self, name, job)
+
+    def rebuild_lut(self, key, slices, apply):
+        # Job for schedule(): build the table for key from its slices unless
+        # it is already shared, then hand it to apply() at the swap. A shared
+        # table is held on to, so it is still there for the swap even if its
+        # last user lets go of it in between and commit() never has to build.
+        table = LUTS.get(key)
+        if table is None:
+            table = yield from slices
+
+        def commit():
+            apply(self.use_lut(key, lambda: table))
+
+        return commit
+
+    def close(self):
+        if self.lut_key is not None:
+            LUTS.release(self.lut_key)
+            self.lut_key = None
 
     def update(self):
         raise NotImplementedError("Subclasses should implement this method")
@@ -158,8 +768,12 @@ class SynthModule:
 
 
 class Input(SynthModule):
+    persistent = True
+    constant = True
+
     def __init__(self, base):
         super().__init__(base)
+        self.value = 0
 
     def get_options(self):
         return ["value"]
@@ -168,289 +782,645 @@ class Input(SynthModule):
         if not isinstance(value, int):
             raise TypeError("Value must be an integer")
 
-        for i in range(self.base.buffer_size):
-            self.buffer[i] = value
+        self.value = value
+        if self.buffer is not None:
+            fill(self.buffer, value, self.base.buffer_size)
 
-    def read(self):
+    def require_buffer(self):
+        if self.buffer is None:
+            self.buffer = array.array("h", [0] * self.base.buffer_size)
+            fill(self.buffer, self.value, self.base.buffer_size)
         return self.buffer
 
+    def configure(self):
+        if self.buffer is not None and len(self.buffer) != self.base.buffer_size:
+            self.buffer = None
+            self.require_buffer()
+
+    def update(self):
+        pass
+
 
 class Oscillator(SynthModule):
+    shape = None
+    constant_inputs = ("frequency",)
+
     def __init__(self, base):
         super().__init__(base)
         self.index = 0
-        self.lut_amount = const(1024)
-        self.lut = array.array("h", [0] * self.lut_amount)
-        self._generate_lut()
+        self.lut_amount = base.lut_size
+        if self.lut_amount & (self.lut_amount - 1):
+            raise ValueError("Table size must be a power of two")
+        self.interpolate = False
+        self.render = self.render_truncated
+        self.set_interpolate(base.interpolate)
+        self._update_lut()
+
+    def _lut_key(self):
+        return (self.shape, self.base.max, self.lut_amount, None)
+
+    def _update_lut(self):
+        self._set_lut(self.use_lut(self._lut_key(), self._generate_lut))
+
+    def _set_lut(self, lut):
+        self.lut = lut
 
     def _generate_lut(self):
         raise NotImplementedError("Subclasses should implement this method")
 
+    def get_options(self):
+        return ["interpolate"]
+
     def get_input_names(self):
         return ["frequency"]
 
-    @micropython.viper
+    def set_interpolate(self, interpolate):
+        self.interpolate = bool(interpolate)
+        if self.interpolate:
+            self.render = self.render_interpolated
+        else:
+            self.render = self.render_truncated
+
+    def get_frequency(self):
+        # Frequency at the start of the block.
+        if self.frequency_buffer is None:
+            return self.frequency_source.value
+        return self.frequency_buffer[0]
+
     def update(self):
+        self.render()
+
+    @micropython.viper
+    def render_truncated(self):
         idx = uint(self.index)
-        frequency = ptr16(self.inputs["frequency"].read())
         buffer_size = uint(self.base.buffer_size)
         buffer = ptr16(self.buffer)
         increment = uint((int(self.lut_amount) << 16) // int(self.base.sample_rate))
         lut = ptr16(self.lut)
         mod = uint(self.lut_amount) - 1
         i = uint(0)
-        while i < buffer_size:
-            buffer[i] = lut[(idx >> 16) & mod]
-            idx += increment * frequency[i]
-            i += 1
+        if self.frequency_buffer is None:
+            # Constant frequency: one phase step for the whole block.
+            step = increment * uint(int(self.frequency_source.value) & 0xFFFF)
+            while i < buffer_size:
+                buffer[i] = lut[(idx >> 16) & mod]
+                idx += step
+                i += 1
+        else:
+            frequency = ptr16(self.frequency_buffer)
+            while i < buffer_size:
+                buffer[i] = lut[(idx >> 16) & mod]
+                idx += increment * frequency[i]
+                i += 1
+
+        self.index = idx
+
+    @micropython.viper
+    def render_interpolated(self):
+        # Linear blend between the two entries around the phase, weighted by
+        # the top 8 fractional bits. ptr16 reads are unsigned, so both
+        # entries are sign extended first.
+        idx = uint(self.index)
+        buffer_size = uint(self.base.buffer_size)
+        buffer = ptr16(self.buffer)
+        increment = uint((int(self.lut_amount) << 16) // int(self.base.sample_rate))
+        lut = ptr16(self.lut)
+        mod = uint(self.lut_amount) - 1
+        i = uint(0)
+        if self.frequency_buffer is None:
+            step = increment * uint(int(self.frequency_source.value) & 0xFFFF)
+            while i < buffer_size:
+                j = (idx >> 16) & mod
+                a = int(lut[j])
+                b = int(lut[(j + 1) & mod])
+                if a > 32767:
+                    a -= 65536
+                if b > 32767:
+                    b -= 65536
+                buffer[i] = a + (((b - a) * int((idx >> 8) & 0xFF)) >> 8)
+                idx += step
+                i += 1
+        else:
+            frequency = ptr16(self.frequency_buffer)
+            while i < buffer_size:
+                j = (idx >> 16) & mod
+                a = int(lut[j])
+                b = int(lut[(j + 1) & mod])
+                if a > 32767:
+                    a -= 65536
+                if b > 32767:
+                    b -= 65536
+                buffer[i] = a + (((b - a) * int((idx >> 8) & 0xFF)) >> 8)
+                idx += increment * frequency[i]
+                i += 1
 
         self.index = idx
 
 
 class Sine(Oscillator):
+    shape = "sine"
+
     def __init__(self, base):
         super().__init__(base)
 
     def _generate_lut(self):
-        for i in range(self.lut_amount):
-            self.lut[i] = int(
-                self.base.max * math.sin(2 * math.pi * i / self.lut_amount)
-            )
+        return sine_table(self.base.max, self.lut_amount)
+
+
+class WavetableOscillator(Oscillator):
+    # Octave mipmapped tables, richest first. update() picks the level for
+    # the block's phase increment so no harmonic ends up above Nyquist; the
+    # kernel itself still does one lookup per sample.
+    def _set_lut(self, mipmap):
+        self.mipmap = mipmap
+        self.lut = mipmap[0]
+
+    def get_level(self, frequency):
+        step = ((self.lut_amount << 16) // self.base.sample_rate) * abs(frequency)
+        limit = (self.lut_amount << 15) // MIPMAP_HARMONICS
+        level = 0
+        last = len(self.mipmap) - 1
+        while step > limit and level < last:
+            limit <<= 1
+            level += 1
+        return level
+
+    def update(self):
+        self.lut = self.mipmap[self.get_level(self.get_frequency())]
+        self.render()
 
 
-class Square(Oscillator):
+class Square(WavetableOscillator):
+    shape = "square"
+
     def __init__(self, base):
         self.duty_cycle = 0.5
         super().__init__(base)
 
+    def _lut_key(self):
+        return (self.shape, self.base.max, self.lut_amount, self.duty_cycle)
+
     def _generate_lut(self):
-        for i in range(self.lut_amount):
-            if i < self.lut_amount * self.duty_cycle:
-                self.lut[i] = int(self.base.max)
-            else:
-                self.lut[i] = -int(self.base.max)
+        return run_slices(self._slices())
+
+    def _slices(self):
+        duty = self.duty_cycle
+
+        def partial(h):
+            c = 4 / (h * math.pi) * math.sin(h * math.pi * duty)
+            return c * math.sin(h * math.pi * duty), c * math.cos(h * math.pi * duty)
+
+        return harmonic_slices(self.base.max, self.lut_amount, partial, 2 * duty - 1)
 
     def get_options(self):
-        return ["duty_cycle"]
+        return ["duty_cycle", "interpolate"]
 
     def set_duty_cycle(self, duty_cycle):
         if not (0 <= duty_cycle <= 1):
             raise ValueError("Duty cycle must be between 0 and 1")
+        if duty_cycle == self.duty_cycle:
+            return
         self.duty_cycle = duty_cycle
-        self._generate_lut()
+        self.schedule(
+            "duty_cycle", self.rebuild_lut(self._lut_key(), self._slices(), self._set_lut)
+        )
+
 
+class Triangle(WavetableOscillator):
+    shape = "triangle"
 
-class Triangle(Oscillator):
     def __init__(self, base):
         super().__init__(base)
 
     def _generate_lut(self):
-        for i in range(self.lut_amount):
-            if i < self.lut_amount // 2:
-                self.lut[i] = int(self.base.max * (2 * i / self.lut_amount - 1))
-            else:
-                self.lut[i] = int(self.base.max * (1 - 2 * (i / self.lut_amount)))
+        def partial(h):
+            if h % 2 == 0:
+                return 0, 0
+            sign = 1 if h % 4 == 1 else -1
+            return sign * 8 / (math.pi * math.pi * h * h), 0
+
+        return harmonic_tables(self.base.max, self.lut_amount, partial)
+
 
+class Sawtooth(WavetableOscillator):
+    shape = "sawtooth"
 
-class Sawtooth(Oscillator):
     def __init__(self, base):
         super().__init__(base)
 
     def _generate_lut(self):
-        for i in range(self.lut_amount):
-            self.lut[i] = int(self.base.max * (2 * i / self.lut_amount - 1))
-            if i >= self.lut_amount // 2:
-                self.lut[i] = -self.lut[i]
+        # Rising ramp from -1 to 1 over one period.
+        def partial(h):
+            return -2 / (math.pi * h), 0
+
+        return harmonic_tables(self.base.max, self.lut_amount, partial)
 
 
 class Noise(SynthModule):
+    types = ("white", "pink", "red", "violet", "blue", "gray", "black")
+
     def __init__(self, base):
         super().__init__(base)
         self.index = 0
-        self.lut_amount = const(1024)
-        self.lut = array.array("h", [0] * self.lut_amount)
         self.type = "white"
-        self._generate_lut()
-
-    def _generate_lut(self):
-        if self.type == "white":
-            for i in range(self.lut_amount):
-                self.lut[i] = random.randint(-self.base.max, self.base.max)
-        elif self.type == "pink":
-            num_rows = 16
-            rows = [random.randint(0, self.base.max) for _ in range(num_rows)]
-            for i in range(self.lut_amount):
-                sum_noise = sum(rows[j] for j in range(num_rows))
-                self.lut[i] = int(sum_noise / num_rows)
-                rows[random.randint(0, num_rows - 1)] = random.randint(
-                    -self.base.max, self.base.max
-                )
-        elif self.type == "red":
-            for i in range(self.lut_amount):
-                if i == 0:
-                    self.lut[i] = random.randint(-self.base.max, self.base.max)
-                else:
-                    self.lut[i] = int(
-                        (
-                            self.lut[i - 1]
-                            + random.randint(-self.base.max, self.base.max)
-                        )
-                        / 2
-                    )
-        elif self.type == "violet":
-            # Violet noise: +6dB per octave (frequency^2 response)
-            for i in range(self.lut_amount):
-                freq_weight = (i / self.lut_amount) ** 2
-                self.lut[i] = int(
-                    self.base.max * freq_weight * (2 * random.random() - 1)
-                )
-        elif self.type == "blue":
-            # Blue noise: +3dB per octave (frequency response)
-            for i in range(self.lut_amount):
-                freq_weight = i / self.lut_amount
-                self.lut[i] = int(
-                    self.base.max * freq_weight * (2 * random.random() - 1)
-                )
-        elif self.type == "gray":
-            # Gray noise: psychoacoustically flat noise
-            a_weights = [1.0, 0.8, 0.6, 0.4, 0.3, 0.2, 0.15, 0.1]
-            for i in range(self.lut_amount):
-                band = min(
-                    int(i * len(a_weights) / self.lut_amount), len(a_weights) - 1
-                )
-                weight = a_weights[band]
-                self.lut[i] = int(self.base.max * weight * (2 * random.random() - 1))
-        elif self.type == "black":
-            # Black noise: -6dB per octave (1/frequency^2 response)
-            for i in range(self.lut_amount):
-                if i == 0:
-                    self.lut[i] = random.randint(-self.base.max, self.base.max)
-                else:
-                    freq_weight = 1.0 / (i / self.lut_amount + 0.01)
-                    self.lut[i] = int(
-                        (
-                            self.lut[i - 1] * 0.7
-                            + random.randint(-self.base.max, self.base.max)
-                            * freq_weight
-                            * 0.3
-                        )
-                        / 1.0
-                    )
-        else:
-            raise ValueError(f"Unknown noise type: {self.type}")
+        self.colour = 0
+        # xorshift32 state, pink rows 0-6, pink sum, red and black
+        # integrators, last sample for the differentiated colours
+        self.state = array.array("i", [0] * 12)
+        self.set_seed(random.getrandbits(32))
 
     def get_options(self):
-        return ["type"]
+        return ["type", "seed"]
 
     def get_input_names(self):
         return []
 
     def set_type(self, noise_type):
-        if noise_type not in [
-            "white",
-            "pink",
-            "red",
-            "violet",
-            "blue",
-            "gray",
-            "black",
-        ]:
-            raise ValueError(
-                f"Noise type must be one of: white, pink, red, violet, blue, gray, black"
-            )
+        if noise_type not in self.types:
+            raise ValueError(f"Noise type must be one of: {', '.join(self.types)}")
+        if noise_type == self.type:
+            return
         self.type = noise_type
+        self.colour = self.types.index(noise_type)
+
+    def set_seed(self, seed):
+        seed = int(seed) & 0xFFFFFFFF
+        if seed == 0:
+            raise ValueError("Seed must be non-zero")
+        self.seed = seed
+        self.index = 0
+        for i in range(len(self.state)):
+            self.state[i] = 0
+        self.state[0] = seed - 0x100000000 if seed > 0x7FFFFFFF else seed
 
     @micropython.viper
     def update(self):
-        idx = uint(self.index)
-        buffer_size = uint(self.base.buffer_size)
         buffer = ptr16(self.buffer)
-        increment = uint((int(self.lut_amount) << 16) // int(self.base.sample_rate))
-        lut = ptr16(self.lut)
-        mod = uint(self.lut_amount) - 1
-        i = uint(0)
+        buffer_size = int(self.base.buffer_size)
+        amplitude = int(self.base.max)
+        state = ptr32(self.state)
+        colour = int(self.colour)
+        pink = colour == 1 or colour == 4
+        red = colour == 2 or colour == 5 or colour == 6
+        black = colour == 6
+        diff = colour == 3 or colour == 4 or colour == 5
+
+        x = uint(state[0])
+        total = state[8]
+        r = state[9]
+        b = state[10]
+        last = state[11]
+        counter = uint(self.index)
+        i = 0
         while i < buffer_size:
-            buffer[i] = lut[(idx >> 16) & mod]
-            idx += increment
+            x = uint(x ^ (x << 13))
+            x = x ^ (x >> 17)
+            x = uint(x ^ (x << 5))
+            white = int(x >> 16) - 32768
+            value = white
+
+            if pink:
+                # Voss-McCartney: row k changes every 2**k samples.
+                counter += 1
+                c = counter
+                k = 0
+                while (c & 1) == 0 and k < 6:
+                    c = c >> 1
+                    k += 1
+                row = (int(x & 0xFFFF) - 32768) >> 3
+                total += row - state[k + 1]
+                state[k + 1] = row
+                value = (total + (white >> 3)) << 1
+            if red:
+                r += (white >> 3) - (r >> 5)
+                value = r
+            if black:
+                b += (r >> 4) - (b >> 5)
+                value = b
+            if diff:
+                if colour == 5:
+                    # gray: lows from red, highs from violet
+                    value = (r + ((white - last) >> 1)) >> 1
+                    last = white
+                else:
+                    delta = value - last
+                    last = value
+                    # violet from white, blue from the quieter pink
+                    value = delta if pink else delta >> 1
+
+            if value > 32767:
+                value = 32767
+            elif value < -32767:
+                value = -32767
+            buffer[i] = (value * amplitude) >> 15
             i += 1
 
-        self.index = idx
+        state[0] = int(x)
+        state[8] = total
+        state[9] = r
+        state[10] = b
+        state[11] = last
+        self.index = counter
 
 
 class Mixer(SynthModule):
     def __init__(self, base):
         super().__init__(base)
+        self.channels = []
+        self.bus = None
+        self.volume_scale = 256
 
     def get_input_names(self):
         input_len = (
-            len([name for name in self.inputs.names() if not name.endswith("_volume")])
+            len([name for name in self.inputs.keys() if not name.endswith("_volume")])
             + 1
         )
         return [f"input{i}" for i in range(input_len)] + [
             f"input{i}_volume" for i in range(input_len)
         ]
 
-    def update(self):
-        for i in range(self.base.buffer_size):
-            self.buffer[i] = 0
-
+    def bind(self, silence):
+        # Every channel is (samples, volume samples or None, constant volume
+        # module or None).
+        channels = []
         for name, module in self.inputs.items():
             if name.endswith("_volume"):
                 continue
-            module_buffer = module.read()
-            module_volume = self.inputs.get(name + "_volume", None)
-            if module_volume is not None:
-                module_volume = module_volume.read()
-            for i in range(self.base.buffer_size):
-                if module_volume is not None:
-                    self.buffer[i] += int(
-                        module_buffer[i] * module_volume[i] / self.base.max
-                    )
-                else:
-                    self.buffer[i] += module_buffer[i]
+            volume = self.inputs.get(name + "_volume", None)
+            if volume is None:
+                channels.append((module.require_buffer(), None, None))
+            elif volume.constant:
+                channels.append((module.require_buffer(), None, volume))
+            else:
+                channels.append((module.require_buffer(), volume.require_buffer(), None))
+        self.channels = channels
+        if self.bus is None or len(self.bus) != self.base.buffer_size:
+            self.bus = array.array("i", [0] * self.base.buffer_size)
+        # Volume samples run from 0 to base.max; this maps them to Q8 gains.
+        self.volume_scale = (256 << 8) // self.base.max
+
+    def update(self):
+        self._clear()
+        for source, volume, control in self.channels:
+            gain = 256
+            if control is not None:
+                gain = control.value * 256 // self.base.max
+            self._add(source, volume, gain)
+        self._saturate()
+
+    @micropython.viper
+    def _clear(self):
+        bus = ptr32(self.bus)
+        buffer_size = int(self.base.buffer_size)
+        i = 0
+        while i < buffer_size:
+            bus[i] = 0
+            i += 1
+
+    @micropython.viper
+    def _add(self, source, volume, gain: int):
+        # Accumulate one channel into the 32-bit bus with a Q8 gain, either
+        # fixed for the block or per sample from the volume samples.
+        bus = ptr32(self.bus)
+        src = ptr16(source)
+        buffer_size = int(self.base.buffer_size)
+        i = 0
+        if volume is None:
+            while i < buffer_size:
+                x = int(src[i])
+                if x > 32767:
+                    x -= 65536
+                bus[i] = bus[i] + ((x * gain) >> 8)
+                i += 1
+        else:
+            vol = ptr16(volume)
+            scale = int(self.volume_scale)
+            while i < buffer_size:
+                x = int(src[i])
+                if x > 32767:
+                    x -= 65536
+                v = int(vol[i])
+                if v > 32767:
+                    v -= 65536
+                bus[i] = bus[i] + ((x * ((v * scale) >> 8)) >> 8)
+                i += 1
+
+    @micropython.viper
+    def _saturate(self):
+        bus = ptr32(self.bus)
+        buf = ptr16(self.buffer)
+        buffer_size = int(self.base.buffer_size)
+        i = 0
+        while i < buffer_size:
+            value = bus[i]
+            if value > 32767:
+                value = 32767
+            elif value < -32768:
+                value = -32768
+            buf[i] = value
+            i += 1
+
+
+# Stands in for the Mixer bus when Output reads plain samples, so the
+# kernel never takes a 32-bit pointer on an int16 buffer.
+NO_BUS = array.array("i")
 
 
 class Output(SynthModule):
+    persistent = True
+
     def __init__(self, base):
         super().__init__(base)
         self.amplitude = 1
+        self.gain = 256
+        self.limit = 0x7FFFFFFF // 256
+        self.knee = 0.75
+        self.threshold = 0
+        self.curve = None
+        self.curve_shift = 0
+        self.bus_buffer = None
+        self.peak_in = 0
+        self.peak_out = 0
+        self._update_curve()
 
     def get_options(self):
-        return ["amplitude"]
+        return ["amplitude", "knee"]
 
     def get_input_names(self):
         return ["input"]
 
+    def bind(self, silence):
+        super().bind(silence)
+        # Read a Mixer's 32-bit bus instead of its saturated samples so the
+        # limiter sees the real level.
+        self.bus_buffer = getattr(self.input_source, "bus", None)
+
     def set_amplitude(self, amplitude):
+        if amplitude < 0:
+            raise ValueError("Amplitude must not be negative")
+        if amplitude == self.amplitude:
+            return
         self.amplitude = amplitude
+        gain = int(amplitude * 256)
+        # Largest input that can be scaled without overflowing 32 bits.
+        limit = 0x7FFFFFFF // max(gain, 1)
+
+        def apply():
+            self.gain = gain
+            self.limit = limit
+
+        self.schedule("amplitude", swap(apply))
+
+    def set_knee(self, knee):
+        if not (0 < knee <= 1):
+            raise ValueError("Knee must be between 0 and 1")
+        if knee == self.knee:
+            return
+        self.knee = knee
+        self.schedule("knee", self._rebuild_curve())
+
+    def _get_curve_shape(self):
+        # Above the threshold the excess goes through a tanh curve that
+        # approaches full scale; the table spans four times the headroom
+        # above the threshold and the kernel interpolates between entries.
+        threshold = int(32767 * self.knee)
+        headroom = 32767 - threshold
+        shift = 0
+        while (256 << shift) < 4 * headroom:
+            shift += 1
+        return ("softclip", 32767, 256, self.knee), threshold, shift
+
+    def _update_curve(self):
+        key, self.threshold, self.curve_shift = self._get_curve_shape()
+        self.curve = self.use_lut(key, self._generate_lut)
+
+    def _rebuild_curve(self):
+        key, threshold, shift = self._get_curve_shape()
+
+        def apply(curve):
+            self.threshold = threshold
+            self.curve_shift = shift
+            self.curve = curve
+
+        return self.rebuild_lut(key, self._slices(threshold, shift), apply)
+
+    def _generate_lut(self):
+        return run_slices(self._slices(self.threshold, self.curve_shift))
+
+    def _slices(self, threshold, shift):
+        headroom = 32767 - threshold
+        curve = array.array("h", [0] * 256)
+        if headroom:
+            for i in range(256):
+                curve[i] = int(headroom * math.tanh((i << shift) / headroom))
+                if i & 31 == 31:
+                    yield
+        return curve
+
+    def get_gain_reduction(self):
+        # Gain reduction of the last block in dB, 0 when nothing was limited.
+        if self.peak_out >= self.peak_in or self.peak_out == 0:
+            return 0.0
+        return 20 * math.log10(self.peak_out / self.peak_in)
 
     @micropython.viper
     def update(self):
-        input_buffer = ptr16(self.inputs["input"].read())
-        buffer_size = uint(self.base.buffer_size)
         buf = ptr16(self.buffer)
-        amplitude = uint(self.amplitude)
-
-        i = uint(0)
+        buffer_size = int(self.base.buffer_size)
+        gain = int(self.gain)
+        limit = int(self.limit)
+        threshold = int(self.threshold)
+        curve = ptr16(self.curve)
+        shift = int(self.curve_shift)
+        mask = (1 << shift) - 1
+        wide = self.bus_buffer is not None
+        bus = ptr32(self.bus_buffer if wide else NO_BUS)
+        source = ptr16(self.input_buffer)
+        peak_in = 0
+        peak_out = 0
+
+        i = 0
         while i < buffer_size:
-            buf[i] = input_buffer[i] * amplitude
+            if wide:
+                x = bus[i]
+            else:
+                x = int(source[i])
+                if x > 32767:
+                    x -= 65536
+            if x > limit:
+                x = limit
+            elif x < -limit:
+                x = -limit
+            y = (x * gain) >> 8
+
+            level = y if y >= 0 else -y
+            if level > peak_in:
+                peak_in = level
+            if level > threshold:
+                excess = level - threshold
+                j = excess >> shift
+                if j >= 255:
+                    level = threshold + int(curve[255])
+                else:
+                    a = int(curve[j])
+                    level = threshold + a + (((int(curve[j + 1]) - a) * (excess & mask)) >> shift)
+                if level > 32767:
+                    level = 32767
+            if level > peak_out:
+                peak_out = level
+
+            buf[i] = level if y >= 0 else -level
             i += 1
 
+        self.peak_in = peak_in
+        self.peak_out = peak_out
+
+
+# Length of the window the two pitch shifter heads sweep, in seconds.
+PITCH_WINDOW = 0.08
+
 
 class PitchShifter(SynthModule):
-    def __init__(self, base):
+    # Two read heads slide through a delay line at the pitch ratio and jump
+    # back by a window when they run out of it. They sit half a window
+    # apart and crossfade with triangular gains that are zero at the jumps.
+    def __init__(self, base, pitch=1.0):
         super().__init__(base)
-        self.pitch = 1.0
-        self.index = 0
-        self.lut_amount = const(1024)
-        self.lut = array.array("h", [0] * self.lut_amount)
-        self._generate_lut()
+        self.window = 0
+        self.line = None
+        self.position = 0
+        # Q24 fraction of the window behind the write position. Starting at
+        # 0 leaves the second head, which carries all the signal at ratio 1,
+        # half a window behind.
+        self.phase = 0
+        self.pitch = 0
+        self.ratio = 0
+        self.phase_step = 0
+        self._allocate()
+        self.set_pitch(pitch)
+
+    def _allocate(self):
+        self.window = int(PITCH_WINDOW * self.base.sample_rate)
+        self.line = array.array("h", bytes(self._line_bytes(self.base)))
+        self.position = 0
+        self.phase = 0
+
+    def configure(self):
+        super().configure()
+        self._allocate()
+        self.phase_step = ((65536 - self.ratio) << 8) // self.window
 
-    def _generate_lut(self):
-        for i in range(self.lut_amount):
-            self.lut[i] = int(
-                self.base.max * math.sin(2 * math.pi * i / self.lut_amount)
-            )
+    @staticmethod
+    def _line_bytes(base):
+        # A power of two, so wrapping an index is a mask.
+        size = 1
+        while size < int(PITCH_WINDOW * base.sample_rate) + 2:
+            size <<= 1
+        return 2 * size
+
+    @classmethod
+    def memory_cost(cls, base):
+        return cls._line_bytes(base)
 
     def get_options(self):
         return ["pitch"]
@@ -461,166 +1431,351 @@ class PitchShifter(SynthModule):
     def set_pitch(self, pitch):
         if not (0 < pitch <= 2):
             raise ValueError("Pitch must be between 0 and 2")
+        if pitch == self.pitch:
+            return
         self.pitch = pitch
+        self.ratio = int(pitch * 65536)
+        # Per sample a head falls behind by 1 - ratio samples.
+        self.phase_step = ((65536 - self.ratio) << 8) // self.window
 
     @micropython.viper
     def update(self):
-        idx = uint(self.index)
-        buffer_size = uint(self.base.buffer_size)
-        buffer = ptr16(self.buffer)
-        increment = uint((int(self.lut_amount) << 16) // int(self.base.sample_rate))
-        lut = ptr16(self.lut)
-        mod = uint(self.lut_amount) - 1
-        i = uint(0)
+        src = ptr16(self.input_buffer)
+        buf = ptr16(self.buffer)
+        buffer_size = int(self.base.buffer_size)
+        line = ptr16(self.line)
+        mask = int(len(self.line)) - 1
+        window = int(self.window)
+        position = int(self.position)
+        phase = int(self.phase)
+        phase_step = int(self.phase_step)
+
+        i = 0
         while i < buffer_size:
-            buffer[i] = lut[(idx >> 16) & mod]
-            idx += increment * int(self.pitch)
+            line[position] = src[i]
+
+            out = 0
+            head = phase
+            h = 0
+            while h < 2:
+                # Delay in Q16 samples and the head's triangular gain in Q15.
+                d = (head >> 8) * window
+                g = head >> 8
+                if g > 32767:
+                    g = 65535 - g
+                at = (position - (d >> 16)) & mask
+                y1 = line[at]
+                if y1 > 32767:
+                    y1 -= 65536
+                y2 = line[(at - 1) & mask]
+                if y2 > 32767:
+                    y2 -= 65536
+                y = y1 + (((y2 - y1) * ((d >> 8) & 0xFF)) >> 8)
+                out += (y * g) >> 15
+                head = (head + 0x800000) & 0xFFFFFF
+                h += 1
+
+            if out > 32767:
+                out = 32767
+            elif out < -32767:
+                out = -32767
+            buf[i] = out
+            position = (position + 1) & mask
+            phase = (phase + phase_step) & 0xFFFFFF
             i += 1
 
-        self.index = idx
+        self.position = position
+        self.phase = phase
+
+
+# Envelope level at full scale; the kernel applies level >> 15 as a Q8 gain.
+ENVELOPE_FULL = const(1 << 23)
+# Exponential segments aim past their end so they reach it in finite time:
+# attack overshoots full scale by 30%, decay and release undershoot by 0.1%.
+ATTACK_RATIO = 0.3
+RELEASE_RATIO = 0.001
+# Seconds a raised sustain takes to reach its new level.
+SUSTAIN_GLIDE = 0.005
 
 
 class Envelope(SynthModule):
+    IDLE = 0
+    ATTACK = 1
+    DECAY = 2
+    SUSTAIN = 3
+    RELEASE = 4
+    # Only ever queued in pending: attack even when already attacking.
+    RESTART = 5
+
     def __init__(self, base, attack=0.1, decay=0.1, sustain=0.5, release=0.1):
         super().__init__(base)
         self.attack = attack
         self.decay = decay
         self.sustain = sustain
         self.release = release
+        self.curve = "linear"
 
         self.active = False
-
-        self.attack_i = 0
-        self.decay_i = 0
-        self.release_i = 0
-
-        self.attack_len = 0
-        self.decay_len = 0
-        self.release_len = 0
-
-        self.attack_lut = None
-        self.decay_lut = None
-        self.release_lut = None
-
-        self._generate_lut()
-
-    def _generate_lut(self):
-        state = 0
-        value = 0.0
-
-        attack = []
-        decay = []
-        release = []
-
-        while state != 3:
-            if state == 0:
-                value += 1.0 / (self.attack * self.base.sample_rate)
-                if value >= 1.0:
-                    value = 1.0
-                    state = 1
-                attack.append(value)
-            elif state == 1:
-                value -= (1.0 - self.sustain) / (self.decay * self.base.sample_rate)
-                if value <= self.sustain:
-                    value = self.sustain
-                    state = 2
-                decay.append(value)
-            elif state == 2:
-                value -= self.sustain / (self.release * self.base.sample_rate)
-                if value <= 0.0:
-                    value = 0.0
-                    state = 3
-                release.append(value)
-
-        self.attack_lut = array.array("h", [get_fixed_float(v) for v in attack])
-        self.decay_lut = array.array("h", [get_fixed_float(v) for v in decay])
-        self.release_lut = array.array("h", [get_fixed_float(v) for v in release])
-
-        self.attack_len = len(self.attack_lut)
-        self.decay_len = len(self.decay_lut)
-        self.release_len = len(self.release_lut)
-        self.attack_i = self.attack_len
-        self.decay_i = self.decay_len
-        self.release_i = self.release_len
-        self.active = False
+        self.stage = Envelope.IDLE
+        self.level = 0
+        # Trigger waiting for the next block, IDLE when there is none. The
+        # kernel owns the segment state while it renders, so note events
+        # from the other core must not write it directly.
+        self.pending = Envelope.IDLE
+        # A release that came in while an attack was still pending; it
+        # follows one block later so the note is heard.
+        self.release_queued = False
+
+        # Current segment: per sample the level moves by step plus coef/65536
+        # of the way to target, until it crosses end.
+        self.step = 0
+        self.coef = 0
+        self.target = 0
+        self.end = 0
+
+        self.sustain_level = 0
+        self.attack_samples = 1
+        self.release_samples = 1
+        self.attack_coef = 0
+        self.decay_step = 0
+        self.decay_coef = 0
+        self.decay_target = 0
+        self.release_coef = 0
+        self._update_segments()
+
+    def _get_coef(self, samples, ratio):
+        # One-pole coefficient in Q16 that covers the distance to a target
+        # ratio beyond the end in the given number of samples.
+        coef = 1 - math.exp(-math.log((1 + ratio) / ratio) / samples)
+        return min(max(int(coef * 65536), 1), 32767)
+
+    def _update_segments(self):
+        sample_rate = self.base.sample_rate
+        self.attack_samples = max(int(self.attack * sample_rate), 1)
+        decay_samples = max(int(self.decay * sample_rate), 1)
+        self.release_samples = max(int(self.release * sample_rate), 1)
+        self.sustain_level = int(self.sustain * ENVELOPE_FULL)
+        drop = ENVELOPE_FULL - self.sustain_level
+
+        if self.curve == "exponential":
+            self.attack_coef = self._get_coef(self.attack_samples, ATTACK_RATIO)
+            self.decay_step = 0
+            self.decay_coef = self._get_coef(decay_samples, RELEASE_RATIO)
+            self.decay_target = self.sustain_level - int(drop * RELEASE_RATIO)
+            self.release_coef = self._get_coef(self.release_samples, RELEASE_RATIO)
+        else:
+            self.attack_coef = 0
+            self.decay_step = -(drop // decay_samples) if drop else 0
+            if drop % decay_samples:
+                self.decay_step -= 1
+            self.decay_coef = 0
+            self.decay_target = 0
+            self.release_coef = 0
+
+    def _enter(self, stage):
+        # Start a segment from wherever the level is now. Linear attack and
+        # release keep their length by deriving the step from that level.
+        level = self.level
+        step = coef = target = end = 0
+        if stage == Envelope.ATTACK:
+            end = ENVELOPE_FULL
+            coef = self.attack_coef
+            if coef:
+                target = ENVELOPE_FULL + int(ENVELOPE_FULL * ATTACK_RATIO)
+            else:
+                step = -(-(ENVELOPE_FULL - level) // self.attack_samples)
+        elif stage == Envelope.DECAY:
+            end = self.sustain_level
+            step = self.decay_step
+            coef = self.decay_coef
+            target = self.decay_target
+        elif stage == Envelope.RELEASE:
+            coef = self.release_coef
+            if coef:
+                target = -int(ENVELOPE_FULL * RELEASE_RATIO)
+            else:
+                step = -level // self.release_samples
+        elif stage == Envelope.SUSTAIN:
+            self.level = self.sustain_level
+
+        self.step = step
+        self.coef = coef
+        self.target = target
+        self.end = end
+        self.stage = stage
+        self.active = stage != Envelope.IDLE
+
+    def configure(self):
+        super().configure()
+        self._apply_settings()
+
+    def _apply_settings(self):
+        def apply():
+            self._update_segments()
+            stage = self.stage
+            if stage == Envelope.SUSTAIN or stage == Envelope.DECAY:
+                if self.sustain_level > self.level:
+                    self._glide()
+                    return
+                # A lower sustain is reached through the decay segment.
+                if self.sustain_level < self.level:
+                    stage = Envelope.DECAY
+            if stage != Envelope.IDLE:
+                self._enter(stage)
+
+        self.schedule("segments", swap(apply))
 
     def get_options(self):
-        return ["attack", "decay", "sustain", "release"]
+        return ["attack", "decay", "sustain", "release", "curve"]
 
     def get_input_names(self):
         return ["input"]
 
     def set_attack(self, attack):
+        if attack <= 0:
+            raise ValueError("Attack must be positive")
+        if attack == self.attack:
+            return
         self.attack = attack
+        self._apply_settings()
 
     def set_decay(self, decay):
+        if decay <= 0:
+            raise ValueError("Decay must be positive")
+        if decay == self.decay:
+            return
         self.decay = decay
+        self._apply_settings()
 
     def set_sustain(self, sustain):
+        if not (0 <= sustain <= 1):
+            raise ValueError("Sustain must be between 0 and 1")
+        if sustain == self.sustain:
+            return
         self.sustain = sustain
+        self._apply_settings()
 
     def set_release(self, release):
+        if release <= 0:
+            raise ValueError("Release must be positive")
+        if release == self.release:
+            return
         self.release = release
+        self._apply_settings()
+
+    def set_curve(self, curve):
+        if curve not in ("linear", "exponential"):
+            raise ValueError("Curve must be linear or exponential")
+        if curve == self.curve:
+            return
+        self.curve = curve
+        self._apply_settings()
+
+    def _glide(self):
+        # Rise to a raised sustain on a short linear attack that ends at the
+        # sustain level; the kernel then settles there through DECAY.
+        level = self.level
+        samples = max(int(SUSTAIN_GLIDE * self.base.sample_rate), 1)
+        self.step = -(-(self.sustain_level - level) // samples)
+        self.coef = 0
+        self.target = 0
+        self.end = self.sustain_level
+        self.stage = Envelope.ATTACK
+        self.active = True
 
     def trigger_attack(self):
-        if self.attack_i == self.attack_len:
-            self.attack_i = 0
-            self.decay_i = 0
-            self.active = True
+        self._trigger(Envelope.ATTACK)
 
     def trigger_release(self):
-        if self.release_i == self.release_len:
-            self.release_i = 0
+        self._trigger(Envelope.RELEASE)
+
+    def restart(self):
+        # Retrigger from the current level, so a stolen voice does not click.
+        self._trigger(Envelope.RESTART)
+
+    def _trigger(self, event):
+        # Takes effect at the start of the next block. Marking the envelope
+        # active right away keeps VoiceManager from handing the voice out
+        # twice and makes it render the block that applies the trigger.
+        if event == Envelope.RELEASE:
+            pending = self.pending
+            if pending == Envelope.ATTACK or pending == Envelope.RESTART:
+                self.release_queued = True
+                return
+        else:
+            self.release_queued = False
+            self.active = True
+        self.pending = event
+
+    def _apply_trigger(self):
+        event = self.pending
+        self.pending = Envelope.IDLE
+        if self.release_queued:
+            self.release_queued = False
+            self.pending = Envelope.RELEASE
+        stage = self.stage
+        if event == Envelope.RESTART:
+            self._enter(Envelope.ATTACK)
+        elif event == Envelope.ATTACK:
+            # A sustain glide is an attack too, but not towards full scale.
+            if stage != Envelope.ATTACK or self.end != ENVELOPE_FULL:
+                self._enter(Envelope.ATTACK)
+        elif event == Envelope.RELEASE:
+            if stage != Envelope.IDLE and stage != Envelope.RELEASE:
+                self._enter(Envelope.RELEASE)
+
+    def get_level(self):
+        return self.level >> 15
 
     def is_active(self):
-        return self.active
+        return self.active or self.pending != Envelope.IDLE
 
     def is_sustaining(self):
-        return (
-            self.attack_i == self.attack_len
-            and self.decay_i == self.decay_len
-            and self.release_i == self.release_len
-            and self.active
-        )
+        return self.stage == Envelope.SUSTAIN
 
     @micropython.viper
     def update(self):
-        active = bool(self.active)
+        if int(self.pending):
+            self._apply_trigger()
         buf = ptr16(self.buffer)
-        buffer_size = uint(self.base.buffer_size)
+        buffer_size = int(self.base.buffer_size)
+        stage = int(self.stage)
 
-        if not active:
-            i = uint(0)
+        if stage == 0:
+            i = 0
             while i < buffer_size:
                 buf[i] = 0
                 i += 1
+            self.active = False
             return
 
-        attack_i = uint(self.attack_i)
-        decay_i = uint(self.decay_i)
-        release_i = uint(self.release_i)
+        level = int(self.level)
+        step = int(self.step)
+        coef = int(self.coef)
+        target = int(self.target)
+        end = int(self.end)
 
-        attack_lut = ptr16(self.attack_lut)
-        decay_lut = ptr16(self.decay_lut)
-        release_lut = ptr16(self.release_lut)
-
-        buffer = ptr16(self.inputs["input"].read())
-        i = uint(0)
+        buffer = ptr16(self.input_buffer)
+        i = 0
         while i < buffer_size:
-            if attack_i < uint(self.attack_len):
-                value = attack_lut[attack_i]
-                attack_i += 1
-            elif decay_i < uint(self.decay_len):
-                value = decay_lut[decay_i]
-                decay_i += 1
-            elif release_i < uint(self.release_len):
-                value = release_lut[release_i]
-                release_i += 1
-                if release_i == uint(self.release_len):
-                    self.active = False
-            elif active:
-                value = decay_lut[uint(self.decay_len) - 1]
-
+            if stage != 3 and stage != 0:
+                level += step + ((((target - level) >> 8) * coef) >> 8)
+                if stage == 1:
+                    if level >= end:
+                        level = end
+                        stage = 2
+                        step = int(self.decay_step)
+                        coef = int(self.decay_coef)
+                        target = int(self.decay_target)
+                        end = int(self.sustain_level)
+                elif level <= end:
+                    level = end
+                    if stage == 2:
+                        stage = 3
+                    else:
+                        stage = 0
+
+            value = level >> 15
             if buffer[i] > 32768:
                 value = 65536 - (((65536 - buffer[i]) * value) >> 8)
             else:
@@ -629,9 +1784,13 @@ class Envelope(SynthModule):
             buf[i] = value
             i += 1
 
-        self.attack_i = attack_i
-        self.decay_i = decay_i
-        self.release_i = release_i
+        self.level = level
+        self.step = step
+        self.coef = coef
+        self.target = target
+        self.end = end
+        self.stage = stage
+        self.active = stage != 0
 
 
 class LowPassFilter(SynthModule):
@@ -640,29 +1799,39 @@ class LowPassFilter(SynthModule):
         self.cutoff = cutoff
         self.prev_input = 0
         self.prev_output = 0
-        self.alpha = 0
-        self._generate_alpha()
+        self.alpha = self._generate_alpha()
 
     def _generate_alpha(self):
         rc = 1.0 / (2 * math.pi * self.cutoff)
         alpha = rc / (rc + (1.0 / self.base.sample_rate))
-        self.alpha = get_fixed_float(alpha)
+        return get_fixed_float(alpha)
 
     def get_options(self):
         return ["cutoff"]
 
+    def configure(self):
+        super().configure()
+        self.alpha = self._generate_alpha()
+
     def get_input_names(self):
         return ["input"]
 
     def set_cutoff(self, cutoff):
         if not (0 < cutoff <= self.base.sample_rate / 2):
             raise ValueError("Cutoff frequency must be between 0 and Nyquist frequency")
+        if cutoff == self.cutoff:
+            return
         self.cutoff = cutoff
-        self._generate_alpha()
+        alpha = self._generate_alpha()
+
+        def apply():
+            self.alpha = alpha
+
+        self.schedule("cutoff", swap(apply))
 
     @micropython.viper
     def update(self):
-        input_buffer = ptr16(self.inputs["input"].read())
+        input_buffer = ptr16(self.input_buffer)
         buffer_size = uint(self.base.buffer_size)
         buf = ptr16(self.buffer)
         alpha = uint(self.alpha)
@@ -693,29 +1862,39 @@ class HighPassFilter(SynthModule):
         self.cutoff = cutoff
         self.prev_input = 0
         self.prev_output = 0
-        self.alpha = 0
-        self._generate_alpha()
+        self.alpha = self._generate_alpha()
 
     def _generate_alpha(self):
         rc = 1.0 / (2 * math.pi * self.cutoff)
         alpha = rc / (rc + (1.0 / self.base.sample_rate))
-        self.alpha = get_fixed_float(alpha)
+        return get_fixed_float(alpha)
 
     def get_options(self):
         return ["cutoff"]
 
+    def configure(self):
+        super().configure()
+        self.alpha = self._generate_alpha()
+
     def get_input_names(self):
         return ["input"]
 
     def set_cutoff(self, cutoff):
         if not (0 < cutoff <= self.base.sample_rate / 2):
             raise ValueError("Cutoff frequency must be between 0 and Nyquist frequency")
+        if cutoff == self.cutoff:
+            return
         self.cutoff = cutoff
-        self._generate_alpha()
+        alpha = self._generate_alpha()
+
+        def apply():
+            self.alpha = alpha
+
+        self.schedule("cutoff", swap(apply))
 
     @micropython.viper
     def update(self):
-        input_buffer = ptr16(self.inputs["input"].read())
+        input_buffer = ptr16(self.input_buffer)
         buffer_size = uint(self.base.buffer_size)
         buf = ptr16(self.buffer)
         alpha = uint(self.alpha)
@@ -740,7 +1919,221 @@ class HighPassFilter(SynthModule):
         self.prev_output = prev_output
 
 
+# Cutoff table of the StateVariableFilter: log spaced steps from
+# SVF_LOWEST Hz to 0.45 * sample_rate.
+SVF_STEPS = const(256)
+SVF_LOWEST = 30
+
+
+class StateVariableFilter(SynthModule):
+    # Trapezoidal (TPT) state variable filter in fixed point. Per cutoff
+    # step the table holds a1 and a2 in Q16 and g in Q13, so a cutoff input
+    # only costs a table read per sample. Samples run internally with 8
+    # extra bits.
+    modes = ("lowpass", "highpass", "bandpass", "notch")
+    constant_inputs = ("cutoff",)
+
+    def __init__(self, base, cutoff=1000.0, resonance=0.0):
+        super().__init__(base)
+        self.cutoff = cutoff
+        self.resonance = resonance
+        self.mode = "lowpass"
+        self.mode_index = 0
+        self.modulation = 1.0
+        self.amount = 256
+        self.index = self._get_index(cutoff)
+        self.k = 0
+        self.ic1 = 0
+        self.ic2 = 0
+        self.cutoff_source = None
+        self.cutoff_buffer = None
+        key, self.k = self._get_shape()
+        self.lut = self.use_lut(key, self._generate_lut)
+
+    def _get_shape(self):
+        # Damping k = 1 / Q from 2 down to 0.04 in Q13.
+        k = int((2 - 1.96 * self.resonance) * 8192)
+        return ("svf", self.base.sample_rate, SVF_STEPS, k), k
+
+    def _get_frequency(self, index):
+        highest = 0.45 * self.base.sample_rate
+        return SVF_LOWEST * (highest / SVF_LOWEST) ** (index / (SVF_STEPS - 1))
+
+    def _get_index(self, cutoff):
+        highest = 0.45 * self.base.sample_rate
+        cutoff = min(max(cutoff, SVF_LOWEST), highest)
+        position = math.log(cutoff / SVF_LOWEST) / math.log(highest / SVF_LOWEST)
+        return int(position * (SVF_STEPS - 1) + 0.5)
+
+    def _generate_lut(self):
+        return run_slices(self._slices(self.k))
+
+    def _slices(self, k):
+        k = k / 8192
+        table = array.array("h", [0] * (3 * SVF_STEPS))
+        for i in range(SVF_STEPS):
+            g = math.tan(math.pi * self._get_frequency(i) / self.base.sample_rate)
+            a1 = 1 / (1 + g * (g + k))
+            # Stored as 16-bit patterns, the kernel reads them unsigned.
+            for j, value in enumerate((a1 * 65536, g * a1 * 65536, g * 8192)):
+                value = min(int(value + 0.5), 65535)
+                table[3 * i + j] = value - 65536 if value > 32767 else value
+            if i & 31 == 31:
+                yield
+        return table
+
+    def get_options(self):
+        return ["cutoff", "resonance", "mode", "modulation"]
+
+    def configure(self):
+        super().configure()
+        self.index = self._get_index(self.cutoff)
+        key, self.k = self._get_shape()
+        self.lut = self.use_lut(key, self._generate_lut)
+
+    def get_input_names(self):
+        return ["input", "cutoff"]
+
+    def bind(self, silence):
+        super().bind(silence)
+        # Without a cutoff input the kernel reads no table per sample.
+        if self.cutoff_source is None:
+            self.cutoff_buffer = None
+
+    def set_cutoff(self, cutoff):
+        if not (0 < cutoff <= self.base.sample_rate / 2):
+            raise ValueError("Cutoff frequency must be between 0 and Nyquist frequency")
+        if cutoff == self.cutoff:
+            return
+        self.cutoff = cutoff
+        self.index = self._get_index(cutoff)
+
+    def set_resonance(self, resonance):
+        if not (0 <= resonance <= 1):
+            raise ValueError("Resonance must be between 0 and 1")
+        if resonance == self.resonance:
+            return
+        self.resonance = resonance
+        key, k = self._get_shape()
+
+        def apply(table):
+            self.lut = table
+            self.k = k
+
+        self.schedule("resonance", self.rebuild_lut(key, self._slices(k), apply))
+
+    def set_mode(self, mode):
+        if mode not in self.modes:
+            raise ValueError(f"Mode must be one of: {', '.join(self.modes)}")
+        self.mode = mode
+        self.mode_index = self.modes.index(mode)
+
+    def set_modulation(self, modulation):
+        # Cutoff steps per unit of the cutoff input: at 1 an input swinging
+        # over +-max sweeps +-max table steps.
+        if not (0 <= modulation <= 1):
+            raise ValueError("Modulation must be between 0 and 1")
+        self.modulation = modulation
+        self.amount = int(modulation * 256)
+
+    @micropython.viper
+    def update(self):
+        src = ptr16(self.input_buffer)
+        buf = ptr16(self.buffer)
+        buffer_size = int(self.base.buffer_size)
+        table = ptr16(self.lut)
+        last = int(SVF_STEPS) - 1
+        amount = int(self.amount)
+        k = int(self.k)
+        mode = int(self.mode_index)
+        ic1 = int(self.ic1)
+        ic2 = int(self.ic2)
+
+        base_index = int(self.index)
+        modulated = self.cutoff_buffer is not None
+        if modulated:
+            cutoff = ptr16(self.cutoff_buffer)
+        else:
+            cutoff = ptr16(self.input_buffer)
+            if self.cutoff_source is not None:
+                base_index += (int(self.cutoff_source.value) * amount) >> 8
+
+        j = base_index
+        if j < 0:
+            j = 0
+        elif j > last:
+            j = last
+        a1 = table[3 * j]
+        a2 = table[3 * j + 1]
+        g = table[3 * j + 2]
+
+        i = 0
+        while i < buffer_size:
+            if modulated:
+                m = cutoff[i]
+                if m > 32767:
+                    m -= 65536
+                j = base_index + ((m * amount) >> 8)
+                if j < 0:
+                    j = 0
+                elif j > last:
+                    j = last
+                a1 = table[3 * j]
+                a2 = table[3 * j + 1]
+                g = table[3 * j + 2]
+
+            x = src[i]
+            if x > 32767:
+                x -= 65536
+            v0 = x << 8
+            v3 = v0 - ic2
+            # Q16 and Q13 products split so no partial product leaves 32 bits
+            v1 = (((ic1 >> 15) * a1) >> 1) + (((ic1 & 0x7FFF) * a1) >> 16)
+            v1 += (((v3 >> 15) * a2) >> 1) + (((v3 & 0x7FFF) * a2) >> 16)
+            v2 = ic2 + ((v1 >> 13) * g) + (((v1 & 0x1FFF) * g) >> 13)
+            ic1 = 2 * v1 - ic1
+            ic2 = 2 * v2 - ic2
+
+            if mode == 0:
+                y = v2
+            elif mode == 2:
+                y = v1
+            else:
+                y = v0 - ((v1 >> 13) * k) - (((v1 & 0x1FFF) * k) >> 13)
+                if mode == 1:
+                    y -= v2
+
+            y = y >> 8
+            if y > 32767:
+                y = 32767
+            elif y < -32767:
+                y = -32767
+            buf[i] = y
+            i += 1
+
+        self.ic1 = ic1
+        self.ic2 = ic2
+
+
+# Freeverb's line lengths in samples at 44.1 kHz.
+REVERB_COMBS = (1116, 1188, 1277, 1356, 1422, 1491, 1557, 1617)
+REVERB_ALLPASSES = (556, 441, 341, 225)
+
+
+def reverb_sizes(base):
+    # Freeverb's tuning scaled to the sample rate, and further down if the
+    # lines would not fit into Config.reverb_memory bytes.
+    total = sum(REVERB_COMBS) + sum(REVERB_ALLPASSES)
+    scale = min(base.sample_rate / 44100, base.reverb_memory / (2 * total))
+    combs = [max(int(size * scale), 1) for size in REVERB_COMBS]
+    allpasses = [max(int(size * scale), 1) for size in REVERB_ALLPASSES]
+    return combs, allpasses
+
+
 class Reverb(SynthModule):
+    # Freeverb with all 12 delay lines in one array: line j lives at
+    # offsets[j] with sizes[j] samples, and its position (plus the damping
+    # filter of every comb) sits in the packed state array.
     def __init__(self, base, roomsize=0.5, damp=0.5, mix=0.5):
         super().__init__(base)
         self.roomsize = roomsize
@@ -753,19 +2146,37 @@ class Reverb(SynthModule):
         self.mix_dry = 0
         self.mix_wet = 0
         self._set_params()
-
-        self.comb_sizes = [1116, 1188, 1277, 1356, 1422, 1491, 1557, 1617]
-        self.comb_buffers = [array.array("h", [0] * s) for s in self.comb_sizes]
-        self.comb_indexes = [0] * 8
-        self.comb_filters = [0] * 8
-
-        self.allpass_sizes = [556, 441, 341, 225]
-        self.allpass_buffers = [array.array("h", [0] * s) for s in self.allpass_sizes]
-        self.allpass_indexes = [0] * 4
+        self._allocate()
+
+    def _allocate(self):
+        self.comb_sizes, self.allpass_sizes = reverb_sizes(self.base)
+        sizes = self.comb_sizes + self.allpass_sizes
+        offsets = []
+        total = 0
+        for size in sizes:
+            offsets.append(total)
+            total += size
+        # Drop the old lines first so both never have to fit at once.
+        self.lines = None
+        self.lines = array.array("h", bytes(2 * total))
+        self.offsets = array.array("i", offsets)
+        self.sizes = array.array("i", sizes)
+        # positions 0-11, comb filters 12-19
+        self.state = array.array("i", [0] * 20)
+
+    def configure(self):
+        super().configure()
+        self._allocate()
+
+    @classmethod
+    def memory_cost(cls, base):
+        combs, allpasses = reverb_sizes(base)
+        return 2 * (sum(combs) + sum(allpasses)) + 4 * (12 + 12 + 20)
 
     def _set_params(self):
-        self.roomsize_fp = int(self.roomsize * 32767)
-        self.damp1_fp = int(self.damp * 32767)
+        # Freeverb's scaling: feedback 0.7 to 0.98, damping up to 0.4.
+        self.roomsize_fp = int((0.7 + 0.28 * self.roomsize) * 32767)
+        self.damp1_fp = int(0.4 * self.damp * 32767)
         self.damp2_fp = 32767 - self.damp1_fp
         self.mix_dry = int((1.0 - self.mix) * 32767)
         self.mix_wet = int(self.mix * 32767)
@@ -779,26 +2190,36 @@ class Reverb(SynthModule):
     def set_roomsize(self, roomsize):
         if not (0 <= roomsize <= 1):
             raise ValueError("Room size must be between 0 and 1")
+        if roomsize == self.roomsize:
+            return
         self.roomsize = roomsize
         self._set_params()
 
     def set_damp(self, damp):
         if not (0 <= damp <= 1):
             raise ValueError("Damp must be between 0 and 1")
+        if damp == self.damp:
+            return
         self.damp = damp
         self._set_params()
 
     def set_mix(self, mix):
         if not (0 <= mix <= 1):
             raise ValueError("Mix must be between 0 and 1")
+        if mix == self.mix:
+            return
         self.mix = mix
         self._set_params()
 
     @micropython.viper
     def update(self):
-        input_buf = ptr16(self.inputs["input"].read())
-        buffer_size = uint(self.base.buffer_size)
+        input_buf = ptr16(self.input_buffer)
+        buffer_size = int(self.base.buffer_size)
         buf = ptr16(self.buffer)
+        lines = ptr16(self.lines)
+        offsets = ptr32(self.offsets)
+        sizes = ptr32(self.sizes)
+        state = ptr32(self.state)
 
         roomsize = int(self.roomsize_fp)
         damp1 = int(self.damp1_fp)
@@ -806,71 +2227,728 @@ class Reverb(SynthModule):
         mix_dry = int(self.mix_dry)
         mix_wet = int(self.mix_wet)
 
-        i = uint(0)
+        i = 0
         while i < buffer_size:
             inp = int(input_buf[i])
-
-            comb_sum = 1
-            j = uint(0)
-            while j < uint(8):
-                b = ptr16(self.comb_buffers[j])
-                idx = uint(self.comb_indexes[j])
-                y = b[idx]
+            if inp > 32767:
+                inp -= 65536
+            feed = inp >> 3
+
+            comb_sum = 0
+            j = 0
+            while j < 8:
+                position = state[j]
+                at = offsets[j] + position
+                y = lines[at]
+                if y > 32767:
+                    y -= 65536
                 comb_sum += y
 
-                f = int(self.comb_filters[j])
-                if y > 32768:
-                    f1 = 65536 - ((65536 - y) * damp2) >> 15
-                else:
-                    f1 = (y * damp2) >> 15
+                # Products round toward zero so the tail decays to silence
+                # instead of settling into a limit cycle.
+                f = y * damp2 + state[12 + j] * damp1
+                if f < 0:
+                    f += 32767
+                f = f >> 15
+                state[12 + j] = f
+                x = f * roomsize
+                if x < 0:
+                    x += 32767
+                x = feed + (x >> 15)
+                if x > 32767:
+                    x = 32767
+                elif x < -32767:
+                    x = -32767
+                lines[at] = x
+
+                position += 1
+                if position == sizes[j]:
+                    position = 0
+                state[j] = position
+                j += 1
 
-                if f > 32768:
-                    f2 = 65536 - ((65536 - f) * damp1) >> 15
-                else:
-                    f2 = (f * damp1) >> 15
+            out = comb_sum >> 2
+            while j < 12:
+                position = state[j]
+                at = offsets[j] + position
+                y = lines[at]
+                if y > 32767:
+                    y -= 65536
+                x = y
+                if x < 0:
+                    x += 1
+                x = out + (x >> 1)
+                if x > 32767:
+                    x = 32767
+                elif x < -32767:
+                    x = -32767
+                lines[at] = x
+                out = y - out
 
-                self.comb_filters[j] = f1 + f2
+                position += 1
+                if position == sizes[j]:
+                    position = 0
+                state[j] = position
+                j += 1
 
-                if f > 32768:
-                    f3 = 65536 - ((65536 - f) * roomsize) >> 15
-                else:
-                    f3 = (f * roomsize) >> 15
+            out = ((inp * mix_dry) >> 15) + ((out * mix_wet) >> 15)
+            if out > 32767:
+                out = 32767
+            elif out < -32767:
+                out = -32767
+            buf[i] = out
+            i += 1
 
-                b[idx] = inp + f3
-                self.comb_indexes[j] = int(idx + 1) % int(self.comb_sizes[j])
-                j += 1
 
-            if comb_sum > 32768:
-                out = 65536 - (((65536 - comb_sum) * 31457) >> 17)
-            else:
-                out = (comb_sum * 31457) >> 17
-
-            j = uint(0)
-            while j < uint(4):
-                b = ptr16(self.allpass_buffers[j])
-                idx = uint(self.allpass_indexes[j])
-                y = b[idx]
-                b[idx] = out + (y >> 1)
-                out = y - out
-                self.allpass_indexes[j] = int(idx + 1) % int(self.allpass_sizes[j])
-                self.allpass_buffers[j] = b
-                j += 1
+class Delay(SynthModule):
+    # Echo with feedback through a one-pole tone filter. The line holds
+    # max_time seconds and is allocated once; the delay time is kept in
+    # Q8 samples and read with linear interpolation, so a time input can
+    # sweep it smoothly.
+    default_max_time = 1.0
+    default_time = 0.3
+    constant_inputs = ("time",)
+
+    def __init__(self, base, max_time=None, time=None, feedback=0.4, tone=0.5,
+                 mix=0.5):
+        super().__init__(base)
+        if max_time is None:
+            max_time = self.default_max_time
+        if max_time <= 0:
+            raise ValueError("Maximum delay time must be positive")
+        if time is None:
+            time = min(self.default_time, max_time)
+        self.max_time = max_time
+        self.line = None
+        self.memory = 0
+        self.position = 0
+        self.lp = 0
+        self._allocate()
+        self.time_source = None
+        self.time_buffer = None
+
+        self.time = 0
+        self.delay = 0
+        self.depth = 0
+        self.feedback = 0
+        self.feedback_fp = 0
+        self.tone = 0
+        self.tone_fp = 0
+        self.mix = 0
+        self.mix_dry = 0
+        self.mix_wet = 0
+        self.modulation = 0
+        self.set_time(time)
+        self.set_feedback(feedback)
+        self.set_tone(tone)
+        self.set_mix(mix)
+
+    @classmethod
+    def memory_cost(cls, base, max_time=None):
+        if max_time is None:
+            max_time = cls.default_max_time
+        # One extra sample for the interpolation at the longest delay.
+        return 2 * (int(max_time * base.sample_rate) + 2)
+
+    def _allocate(self):
+        self.line = None
+        self.line = array.array("h", bytes(self.memory_cost(self.base, self.max_time)))
+        self.memory = len(self.line) * 2
+        self.position = 0
+        self.lp = 0
+
+    def configure(self):
+        super().configure()
+        self._allocate()
+        self._update_delay()
 
-            # mixed = (s * mix_dry) >> 16  # + ((out * mix_wet) >> 15)
+    def get_options(self):
+        return ["time", "feedback", "tone", "mix", "modulation", "memory"]
 
-            if inp > 32768:
-                mixed1 = 65536 - (((65536 - inp) * mix_dry) >> 15)
-            else:
-                mixed1 = (inp * mix_dry) >> 15
+    def get_input_names(self):
+        return ["input", "time"]
 
-            # mixed = 0
-            if out > 32768:
-                mixed2 = 65536 - (((65536 - out) * mix_wet) >> 15)
-            else:
-                mixed2 = (out * mix_wet) >> 15
+    def bind(self, silence):
+        super().bind(silence)
+        if self.time_source is None:
+            self.time_buffer = None
+
+    def set_time(self, time):
+        if not (0 < time <= self.max_time):
+            raise ValueError(f"Delay time must be between 0 and {self.max_time}")
+        if time == self.time:
+            return
+        self.time = time
+        self._update_delay()
+
+    def set_modulation(self, modulation):
+        # At 1 a time input swinging over +-max sweeps the delay between
+        # zero and twice the set time.
+        if not (0 <= modulation <= 1):
+            raise ValueError("Modulation must be between 0 and 1")
+        if modulation == self.modulation:
+            return
+        self.modulation = modulation
+        self._update_delay()
+
+    def _update_delay(self):
+        delay = int(self.time * self.base.sample_rate * 256)
+        depth = int(self.modulation * delay / self.base.max)
+
+        def apply():
+            self.delay = delay
+            self.depth = depth
+
+        self.schedule("time", swap(apply))
+
+    def set_feedback(self, feedback):
+        if not (0 <= feedback < 1):
+            raise ValueError("Feedback must be at least 0 and below 1")
+        if feedback == self.feedback:
+            return
+        self.feedback = feedback
+        self.feedback_fp = int(feedback * 32767)
+
+    def set_tone(self, tone):
+        # 1 keeps the repeats bright, lower values darken every repeat.
+        if not (0 <= tone <= 1):
+            raise ValueError("Tone must be between 0 and 1")
+        if tone == self.tone:
+            return
+        self.tone = tone
+        self.tone_fp = int((0.05 + 0.95 * tone) * 32767)
+
+    def set_mix(self, mix):
+        if not (0 <= mix <= 1):
+            raise ValueError("Mix must be between 0 and 1")
+        if mix == self.mix:
+            return
+        self.mix = mix
+        self.mix_dry = int((1.0 - mix) * 32767)
+        self.mix_wet = int(mix * 32767)
+
+    @micropython.viper
+    def update(self):
+        src = ptr16(self.input_buffer)
+        buf = ptr16(self.buffer)
+        buffer_size = int(self.base.buffer_size)
+        line = ptr16(self.line)
+        size = int(len(self.line))
+        # Longest delay that still has a sample to interpolate towards.
+        longest = (size - 2) << 8
+        position = int(self.position)
+        lp = int(self.lp)
+        depth = int(self.depth)
+        feedback = int(self.feedback_fp)
+        tone = int(self.tone_fp)
+        mix_dry = int(self.mix_dry)
+        mix_wet = int(self.mix_wet)
+
+        delay = int(self.delay)
+        modulated = self.time_buffer is not None
+        if modulated:
+            times = ptr16(self.time_buffer)
+        else:
+            times = ptr16(self.input_buffer)
+            if self.time_source is not None:
+                delay += int(self.time_source.value) * depth
 
-            # buf[i] = input_buf[i]
-            buf[i] = mixed1 + mixed2
-            # print(out)
-            # print(mixed)
+        d = delay
+        i = 0
+        while i < buffer_size:
+            if modulated:
+                m = times[i]
+                if m > 32767:
+                    m -= 65536
+                d = delay + m * depth
+            if d < 256:
+                d = 256
+            elif d > longest:
+                d = longest
+
+            at = position - (d >> 8)
+            if at < 0:
+                at += size
+            before = at - 1
+            if before < 0:
+                before += size
+            y1 = line[at]
+            if y1 > 32767:
+                y1 -= 65536
+            y2 = line[before]
+            if y2 > 32767:
+                y2 -= 65536
+            y = y1 + (((y2 - y1) * (d & 0xFF)) >> 8)
+
+            x = src[i]
+            if x > 32767:
+                x -= 65536
+
+            # Products round toward zero so repeats die out completely.
+            t = (y - lp) * tone
+            if t < 0:
+                t += 32767
+            lp += t >> 15
+            t = lp * feedback
+            if t < 0:
+                t += 32767
+            t = x + (t >> 15)
+            if t > 32767:
+                t = 32767
+            elif t < -32767:
+                t = -32767
+            line[position] = t
+            position += 1
+            if position == size:
+                position = 0
+
+            out = ((x * mix_dry) >> 15) + ((y * mix_wet) >> 15)
+            if out > 32767:
+                out = 32767
+            elif out < -32767:
+                out = -32767
+            buf[i] = out
             i += 1
+
+        self.position = position
+        self.lp = lp
+
+
+CHORUS_VOICES = const(4)
+# Centre delay and largest swing of every mode, in seconds.
+CHORUS_MODES = {"chorus": (0.012, 0.008), "flanger": (0.003, 0.0025)}
+
+
+class Chorus(SynthModule):
+    # Up to CHORUS_VOICES taps on one short line, swept by a triangle LFO
+    # with evenly spread phases. The LFO runs once per block; inside the
+    # block every tap moves on a straight line towards its next position.
+    modes = ("chorus", "flanger")
+
+    def __init__(self, base, mode="chorus", rate=0.8, depth=0.5, voices=2,
+                 feedback=0.0, mix=0.5):
+        super().__init__(base)
+        self.line = None
+        self.position = 0
+        self._allocate()
+        # Q24 LFO phase; voice v runs v / voices of a period ahead.
+        self.phase = 0
+        self.phase_step = 0
+        self.starts = array.array("i", [0] * CHORUS_VOICES)
+        self.steps = array.array("i", [0] * CHORUS_VOICES)
+
+        self.mode = None
+        self.centre = 0
+        self.swing = 0
+        self.rate = 0
+        self.depth = 0
+        self.voices = 0
+        self.voice_gain = 0
+        self.feedback = 0
+        self.feedback_fp = 0
+        self.mix = 0
+        self.mix_dry = 0
+        self.mix_wet = 0
+        self.set_mode(mode)
+        self.set_rate(rate)
+        self.set_depth(depth)
+        self.set_voices(voices)
+        self.set_feedback(feedback)
+        self.set_mix(mix)
+
+    @staticmethod
+    def _line_bytes(base):
+        longest = max(centre + swing for centre, swing in CHORUS_MODES.values())
+        return 2 * (int(longest * base.sample_rate) + 2)
+
+    @classmethod
+    def memory_cost(cls, base):
+        return cls._line_bytes(base) + 8 * CHORUS_VOICES
+
+    def _allocate(self):
+        self.line = None
+        self.line = array.array("h", bytes(self._line_bytes(self.base)))
+        self.position = 0
+
+    def configure(self):
+        super().configure()
+        self._allocate()
+        self._update_sweep()
+        self._update_rate()
+        for v in range(self.voices):
+            self.starts[v] = self.centre
+            self.steps[v] = 0
+
+    def get_options(self):
+        return ["mode", "rate", "depth", "voices", "feedback", "mix"]
+
+    def get_input_names(self):
+        return ["input"]
+
+    def set_mode(self, mode):
+        if mode not in CHORUS_MODES:
+            raise ValueError(f"Mode must be one of {self.modes}")
+        if mode == self.mode:
+            return
+        self.mode = mode
+        self._update_sweep()
+
+    def set_rate(self, rate):
+        if not (0 < rate <= 10):
+            raise ValueError("Rate must be above 0 and at most 10 Hz")
+        if rate == self.rate:
+            return
+        self.rate = rate
+        self._update_rate()
+
+    def _update_rate(self):
+        # The LFO moves once per block.
+        self.phase_step = int(
+            self.rate * self.base.buffer_size / self.base.sample_rate * (1 << 24)
+        )
+
+    def set_depth(self, depth):
+        if not (0 <= depth <= 1):
+            raise ValueError("Depth must be between 0 and 1")
+        if depth == self.depth:
+            return
+        self.depth = depth
+        self._update_sweep()
+
+    def set_voices(self, voices):
+        voices = int(voices)
+        if not (1 <= voices <= CHORUS_VOICES):
+            raise ValueError(f"Voices must be between 1 and {CHORUS_VOICES}")
+        if voices == self.voices:
+            return
+        # New taps glide in from the centre instead of from zero.
+        for v in range(self.voices, voices):
+            self.starts[v] = self.centre
+            self.steps[v] = 0
+        self.voices = voices
+        self.voice_gain = 32767 // voices
+
+    def set_feedback(self, feedback):
+        if not (0 <= feedback < 1):
+            raise ValueError("Feedback must be at least 0 and below 1")
+        if feedback == self.feedback:
+            return
+        self.feedback = feedback
+        self.feedback_fp = int(feedback * 32767)
+
+    def set_mix(self, mix):
+        if not (0 <= mix <= 1):
+            raise ValueError("Mix must be between 0 and 1")
+        if mix == self.mix:
+            return
+        self.mix = mix
+        self.mix_dry = int((1.0 - mix) * 32767)
+        self.mix_wet = int(mix * 32767)
+
+    def _update_sweep(self):
+        if self.mode is None:
+            return
+        centre, swing = CHORUS_MODES[self.mode]
+        sample_rate = self.base.sample_rate
+        # Q8 samples, kept one sample away from the write position.
+        self.swing = int(swing * self.depth * sample_rate * 256)
+        self.centre = max(int(centre * sample_rate * 256), self.swing + 256)
+
+    def _advance_lfo(self):
+        # Land every tap where the previous block left it and aim it at the
+        # LFO position one block later.
+        buffer_size = self.base.buffer_size
+        self.phase = (self.phase + self.phase_step) & 0xFFFFFF
+        spread = 0x1000000 // self.voices
+        centre = self.centre
+        swing = self.swing
+        starts = self.starts
+        steps = self.steps
+        for v in range(self.voices):
+            starts[v] += steps[v] * buffer_size
+            p = ((self.phase + v * spread) & 0xFFFFFF) >> 8
+            if p > 32767:
+                p = 65535 - p
+            target = centre + (swing * (2 * p - 32767) >> 15)
+            steps[v] = (target - starts[v]) // buffer_size
+
+    @micropython.viper
+    def update(self):
+        self._advance_lfo()
+        src = ptr16(self.input_buffer)
+        buf = ptr16(self.buffer)
+        buffer_size = int(self.base.buffer_size)
+        line = ptr16(self.line)
+        size = int(len(self.line))
+        starts = ptr32(self.starts)
+        steps = ptr32(self.steps)
+        voices = int(self.voices)
+        position = int(self.position)
+        voice_gain = int(self.voice_gain)
+        feedback = int(self.feedback_fp)
+        mix_dry = int(self.mix_dry)
+        mix_wet = int(self.mix_wet)
+
+        i = 0
+        while i < buffer_size:
+            acc = 0
+            v = 0
+            while v < voices:
+                d = starts[v] + steps[v] * i
+                at = position - (d >> 8)
+                if at < 0:
+                    at += size
+                before = at - 1
+                if before < 0:
+                    before += size
+                y1 = line[at]
+                if y1 > 32767:
+                    y1 -= 65536
+                y2 = line[before]
+                if y2 > 32767:
+                    y2 -= 65536
+                acc += y1 + (((y2 - y1) * (d & 0xFF)) >> 8)
+                v += 1
+            wet = (acc * voice_gain) >> 15
+
+            x = src[i]
+            if x > 32767:
+                x -= 65536
+            t = wet * feedback
+            if t < 0:
+                t += 32767
+            t = x + (t >> 15)
+            if t > 32767:
+                t = 32767
+            elif t < -32767:
+                t = -32767
+            line[position] = t
+            position += 1
+            if position == size:
+                position = 0
+
+            out = ((x * mix_dry) >> 15) + ((wet * mix_wet) >> 15)
+            if out > 32767:
+                out = 32767
+            elif out < -32767:
+                out = -32767
+            buf[i] = out
+            i += 1
+
+        self.position = position
+
+
+# Rough heap use of the module objects behind one VoiceManager voice.
+VOICE_BYTES = const(1024)
+
+
+class Voice:
+    def __init__(self, base, oscillators, filter):
+        self.frequency = Input(base)
+        self.oscillators = [oscillator(base) for oscillator in oscillators]
+        self.envelope = Envelope(base)
+        self.filter = None if filter is None else filter(base)
+        self.note = None
+        self.started = 0
+
+    def bind(self, first, second):
+        # Voices render one after another, so all of them run through the
+        # same two scratch buffers. The result ends up in the one returned.
+        for i, oscillator in enumerate(self.oscillators):
+            oscillator.frequency_source = self.frequency
+            oscillator.frequency_buffer = None
+            oscillator.buffer = first if i == 0 else second
+        self.envelope.input_buffer = first
+        self.envelope.buffer = second
+        if self.filter is None:
+            return second
+        self.filter.input_buffer = second
+        self.filter.buffer = first
+        return first
+
+    def is_active(self):
+        return self.envelope.is_active()
+
+    def configure(self):
+        self.frequency.configure()
+        for oscillator in self.oscillators:
+            oscillator.configure()
+        self.envelope.configure()
+        if self.filter is not None:
+            self.filter.configure()
+
+    def close(self):
+        for oscillator in self.oscillators:
+            oscillator.close()
+        self.envelope.close()
+        if self.filter is not None:
+            self.filter.close()
+
+
+class VoiceManager(SynthModule):
+    def __init__(self, base, voices=4, oscillators=None, filter=LowPassFilter,
+                 stealing="oldest"):
+        super().__init__(base)
+        if oscillators is None:
+            oscillators = [Sine]
+        self.oscillators = oscillators
+        self.filter = filter
+        self.stealing = None
+        self.voices = []
+        self.count = 0
+        self.notes = 0
+        self.first = array.array("h", [0] * base.buffer_size)
+        self.second = array.array("h", [0] * base.buffer_size)
+        self.result = self.first
+        self.set_stealing(stealing)
+        self.set_voices(voices)
+
+    def get_options(self):
+        return ["voices", "stealing"]
+
+    def configure(self):
+        super().configure()
+        self.first = array.array("h", [0] * self.base.buffer_size)
+        self.second = array.array("h", [0] * self.base.buffer_size)
+        for voice in self.voices:
+            voice.configure()
+            self.result = voice.bind(self.first, self.second)
+
+    @classmethod
+    def memory_cost(cls, base, voices=4, oscillators=None, filter=LowPassFilter):
+        # The two scratch buffers are shared; every voice brings its own
+        # modules.
+        if oscillators is None:
+            oscillators = [Sine]
+        modules = list(oscillators) + [Envelope]
+        if filter is not None:
+            modules.append(filter)
+        voice = VOICE_BYTES + sum(module.memory_cost(base) for module in modules)
+        return 4 * base.buffer_size + voices * voice
+
+    def set_voices(self, voices):
+        voices = int(voices)
+        if voices < 1:
+            raise ValueError("VoiceManager needs at least one voice")
+        if voices == self.count:
+            return
+        self.count = voices
+
+        def apply():
+            self._resize(voices)
+
+        self.schedule("voices", swap(apply))
+
+    def _resize(self, count):
+        # Voices that stay keep playing; only the tail is dropped or grown.
+        # The new ones share the tables the others already hold.
+        voices = self.voices[:count]
+        for voice in self.voices[count:]:
+            voice.close()
+        while len(voices) < count:
+            voice = Voice(self.base, self.oscillators, self.filter)
+            self.result = voice.bind(self.first, self.second)
+            voices.append(voice)
+        self.voices = voices
+
+    def set_stealing(self, stealing):
+        if stealing not in ("oldest", "quietest"):
+            raise ValueError("Stealing must be 'oldest' or 'quietest'")
+        self.stealing = stealing
+
+    def set_template(self, oscillators, filter=LowPassFilter):
+        if not oscillators:
+            raise ValueError("A voice needs at least one oscillator")
+        self.oscillators = oscillators
+        self.filter = filter
+        count = len(self.voices)
+        self.close()
+        self._resize(count)
+
+    def close(self):
+        for voice in self.voices:
+            voice.close()
+        self.voices = []
+
+    def note_on(self, frequency, note=None):
+        if note is None:
+            note = frequency
+        voice = self._find_free()
+        if voice is None:
+            voice = self._steal()
+        voice.frequency.set_value(int(frequency))
+        voice.envelope.restart()
+        voice.note = note
+        self.notes += 1
+        voice.started = self.notes
+        return voice
+
+    def note_off(self, note):
+        for voice in self.voices:
+            if voice.note == note:
+                voice.envelope.trigger_release()
+                voice.note = None
+
+    def all_notes_off(self):
+        for voice in self.voices:
+            if voice.note is not None:
+                voice.envelope.trigger_release()
+                voice.note = None
+
+    def get_active_voices(self):
+        return len([voice for voice in self.voices if voice.is_active()])
+
+    def _find_free(self):
+        for voice in self.voices:
+            if not voice.is_active():
+                return voice
+        return None
+
+    def _steal(self):
+        # Voices that are already releasing go first, held notes only when
+        # every voice is held.
+        candidates = [voice for voice in self.voices if voice.note is None]
+        if not candidates:
+            candidates = self.voices
+        if self.stealing == "quietest":
+            return min(candidates, key=lambda voice: voice.envelope.get_level())
+        return min(candidates, key=lambda voice: voice.started)
+
+    def update(self):
+        size = self.base.buffer_size
+        result = self.result
+        fill(self.buffer, 0, size)
+        for voice in self.voices:
+            if not voice.is_active():
+                continue
+            oscillators = voice.oscillators
+            oscillators[0].update()
+            for i in range(1, len(oscillators)):
+                oscillators[i].update()
+                accumulate(self.first, self.second, size)
+            voice.envelope.update()
+            if voice.filter is not None:
+                voice.filter.update()
+            accumulate(self.buffer, result, size)
+
+    def max_polyphony(self, sample_rate=None, buffer_size=None, headroom=0.8,
+                      blocks=20):
+        # Render one voice of this template at the given rate and block size
+        # and see how many fit into the block deadline.
+        base = Config()
+        base.sample_rate = sample_rate or self.base.sample_rate
+        base.buffer_size = buffer_size or self.base.buffer_size
+        base.max = self.base.max
+        probe = VoiceManager(base, 1, self.oscillators, self.filter)
+        probe.buffer = array.array("h", [0] * base.buffer_size)
+        probe.note_on(440)
+
+        t1 = time.ticks_us()
+        for _ in range(blocks):
+            probe.voices[0].envelope.restart()
+            probe.update()
+        per_voice = time.ticks_diff(time.ticks_us(), t1) / blocks
+        probe.close()
+
+        deadline = base.buffer_size * 1_000_000 / base.sample_rate
+        return int(deadline * headroom // max(per_voice, 1))
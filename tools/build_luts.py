@@ -0,0 +1,92 @@
+import argparse
+import array
+import sys
+
+sys.path.insert(0, ".")
+
+import host
+
+host.install()
+
+import synth
+
+# Pre-generates the standard tables (oscillator shapes, the default filter
+# coefficients and the Output limiter curve) into luts.py as little-endian
+# bytes constants.
+# synth.LUTS hands them out as memoryviews instead of building them at boot.
+# Frozen into the firmware (see manifest.py) they stay in flash; copied to
+# the filesystem as luts.py or luts.mpy they still skip the generation.
+#
+#   python tools/build_luts.py --sample-rates 8000,16000
+
+
+def to_bytes(table):
+    table = array.array("h", table)
+    if sys.byteorder != "little":
+        table.byteswap()
+    return table.tobytes()
+
+
+def collect(sample_rates, duty_cycles, amplitude):
+    # Build every standard table once through the modules themselves, so
+    # the keys and contents match what the firmware would generate.
+    synth.FROZEN_LUTS = {}
+    synth.LUTS = synth.LutCache()
+    modules = []
+    for sample_rate in sample_rates:
+        base = synth.Config()
+        base.sample_rate = sample_rate
+        base.max = amplitude
+        for cls in (
+            synth.Sine,
+            synth.Triangle,
+            synth.Sawtooth,
+            synth.StateVariableFilter,
+        ):
+            modules.append(cls(base))
+        for duty_cycle in duty_cycles:
+            square = synth.Square(base)
+            square.set_duty_cycle(duty_cycle)
+            modules.append(square)
+    modules.append(synth.Output(synth.Config()))
+    return {key: entry[0] for key, entry in synth.LUTS.tables.items()}
+
+
+def write(tables, path):
+    with open(path, "w") as f:
+        f.write("# Generated by tools/build_luts.py, do not edit.\n")
+        f.write("TABLES = {\n")
+        for key in sorted(tables, key=repr):
+            table = tables[key]
+            if isinstance(table, tuple):
+                value = "(" + ", ".join(repr(to_bytes(t)) for t in table) + ")"
+            else:
+                value = repr(to_bytes(table))
+            f.write(f"    {key!r}: {value},\n")
+        f.write("}\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", default="luts.py")
+    parser.add_argument("--sample-rates", default="8000")
+    parser.add_argument("--duty-cycles", default="0.5")
+    parser.add_argument("--max", type=int, default=synth.Config().max)
+    args = parser.parse_args(argv)
+
+    tables = collect(
+        [int(rate) for rate in args.sample_rates.split(",")],
+        [float(duty) for duty in args.duty_cycles.split(",")],
+        args.max,
+    )
+    write(tables, args.output)
+
+    size = sum(
+        sum(len(t) * 2 for t in table) if isinstance(table, tuple) else len(table) * 2
+        for table in tables.values()
+    )
+    print(f"{len(tables)} tables, {size} bytes -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()